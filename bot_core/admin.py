@@ -3,14 +3,12 @@ import json
 import re
 from typing import Optional
 
-import requests
-from dateutil.tz import gettz
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
-from .utils import mask_secret, mask_email
+from .utils import mask_secret, mask_email, is_known_tz
 from .menus import build_main_menu
-from .storage import get_active
+from .storage import get_active, db_run
 from db import (
     get_bot_instance,
     add_bot_instance,
@@ -28,11 +26,11 @@ from db import (
 )
 
 
-def _admin_owner_ok(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+async def _admin_owner_ok(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     bot_id = (context.application.bot_data or {}).get("bot_id")
     if not bot_id:
         return False
-    bot = get_bot_instance(bot_id)
+    bot = await db_run(get_bot_instance, bot_id)
     owner_id = bot.get("owner_telegram_id") if bot else None
     return bool(owner_id and int(owner_id) == int(update.effective_user.id))
 
@@ -43,20 +41,17 @@ def _sanitize_bot_id(raw: str) -> str:
     return base or "bot"
 
 
-def _tg_get_bot_info(token: str) -> Optional[dict]:
+async def _tg_get_bot_info(token: str) -> Optional[dict]:
+    # Bot.initialize() performs getMe on PTB's async client, so the loop isn't blocked.
     try:
-        r = requests.get(f"https://api.telegram.org/bot{token}/getMe", timeout=10)
-        if 200 <= r.status_code < 300:
-            j = r.json() or {}
-            if j.get("ok") and isinstance(j.get("result"), dict):
-                return j["result"]
+        async with Bot(token) as bot:
+            return bot.bot.to_dict()
     except Exception:
-        pass
-    return None
+        return None
 
 
 async def admin_add_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not _admin_owner_ok(update, context):
+    if not await _admin_owner_ok(update, context):
         await update.message.reply_text("⛔ Not authorized.")
         return
     if not context.args:
@@ -68,7 +63,7 @@ async def admin_add_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return False
         if s.upper() in ("UTC", "GMT"):
             return True
-        return ("/" in s) and (gettz(s) is not None)
+        return ("/" in s) and is_known_tz(s)
 
     args = context.args[:]
     token_idx = next((i for i, a in enumerate(args) if ":" in a), None)
@@ -81,19 +76,19 @@ async def admin_add_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     tz = None
     if rest and _looks_like_tz(rest[-1]):
         tz = rest[-1].strip()
-        if gettz(tz) is None and tz.upper() not in ("UTC", "GMT"):
+        if not is_known_tz(tz):
             await update.message.reply_text("Invalid timezone. Example: America/Toronto")
             return
         rest = rest[:-1]
 
     name = " ".join(rest).strip() or None
 
-    info = _tg_get_bot_info(token)
+    info = await _tg_get_bot_info(token)
     username = (info or {}).get("username")
     bot_name = name or username or "New Bot"
     bot_id = _sanitize_bot_id(username or bot_name)
 
-    add_bot_instance(bot_id, token, bot_name, role="user", default_timezone=tz)
+    await db_run(add_bot_instance, bot_id, token, bot_name, role="user", default_timezone=tz)
     tz_disp = tz or "UTC"
     bot_id_disp = html.escape(str(bot_id))
     bot_name_disp = html.escape(str(bot_name))
@@ -138,7 +133,7 @@ def _resolve_delete_target(raw: str) -> tuple[Optional[str], str]:
 
 
 async def admin_delete_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not _admin_owner_ok(update, context):
+    if not await _admin_owner_ok(update, context):
         await update.message.reply_text("⛔ Not authorized.")
         return
     if not context.args:
@@ -146,12 +141,12 @@ async def admin_delete_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     target = " ".join(context.args).strip()
-    bot_id, err = _resolve_delete_target(target)
+    bot_id, err = await db_run(_resolve_delete_target, target)
     if not bot_id:
         await update.message.reply_text(err or "Bot not found.")
         return
 
-    ok, reason = delete_bot_instance(bot_id)
+    ok, reason = await db_run(delete_bot_instance, bot_id)
     if not ok:
         if reason == "cannot_delete_admin":
             await update.message.reply_text("⛔ Cannot delete the admin bot.")
@@ -170,10 +165,10 @@ async def admin_delete_bot(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def admin_list_bots(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not _admin_owner_ok(update, context):
+    if not await _admin_owner_ok(update, context):
         await update.message.reply_text("⛔ Not authorized.")
         return
-    bots = list_bot_instances()
+    bots = await db_run(list_bot_instances)
     if not bots:
         await update.message.reply_text("No bots registered.")
         return
@@ -194,16 +189,23 @@ async def admin_list_bots(update: Update, context: ContextTypes.DEFAULT_TYPE):
         btn_label = f"{b.get('bot_id') or '—'} • {b.get('bot_name') or 'Bot'}"
         buttons.append([InlineKeyboardButton(btn_label, callback_data=f"admin_manage:{b.get('bot_id')}")])
     reply_markup = InlineKeyboardMarkup(buttons) if buttons else None
-    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
+    text = "\n".join(lines)
+    if reply_markup and len(text) + 26 <= 4096:
+        # one round-trip: the manage buttons ride on the list itself
+        await update.message.reply_text(
+            text + "\n\nSelect a bot to manage:", parse_mode="HTML", reply_markup=reply_markup
+        )
+        return
+    await update.message.reply_text(text, parse_mode="HTML")
     if reply_markup:
         await update.message.reply_text("Select a bot to manage:", reply_markup=reply_markup)
 
 
 async def admin_list_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not _admin_owner_ok(update, context):
+    if not await _admin_owner_ok(update, context):
         await update.message.reply_text("⛔ Not authorized.")
         return
-    rows = get_all_users()
+    rows = await db_run(get_all_users)
     if not rows:
         await update.message.reply_text("No users in DB.")
         return
@@ -266,7 +268,7 @@ async def admin_botinfo_callback(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     if not query:
         return
-    if not _admin_owner_ok(update, context):
+    if not await _admin_owner_ok(update, context):
         await query.answer("Not authorized.", show_alert=True)
         return
     data = query.data or ""
@@ -287,7 +289,7 @@ async def admin_manage_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     if not query:
         return
-    if not _admin_owner_ok(update, context):
+    if not await _admin_owner_ok(update, context):
         await query.answer("Not authorized.", show_alert=True)
         return
     data = query.data or ""
@@ -296,7 +298,7 @@ async def admin_manage_callback(update: Update, context: ContextTypes.DEFAULT_TY
         return
     bot_id = data.split(":", 1)[1].strip()
     await query.answer()
-    bot = get_bot_instance(bot_id)
+    bot = await db_run(get_bot_instance, bot_id)
     if not bot:
         await query.edit_message_text("Bot not found.")
         return
@@ -306,7 +308,7 @@ async def admin_manage_callback(update: Update, context: ContextTypes.DEFAULT_TY
         return
     context.user_data["admin_target_bot_id"] = bot_id
     context.user_data["admin_target_user_id"] = int(owner_id)
-    is_active = get_active(bot_id, int(owner_id))
+    is_active = await db_run(get_active, bot_id, int(owner_id))
     menu, status_text = build_main_menu(is_active)
     admin_kb = [
         [InlineKeyboardButton("📋 Historique des offres", callback_data=f"admin_offers:{bot_id}:{owner_id}:0")],
@@ -319,7 +321,7 @@ async def admin_manage_callback(update: Update, context: ContextTypes.DEFAULT_TY
 
 
 async def _send_bot_info(update: Update, bot_id: str, show_full_token: bool = False):
-    bot = get_bot_instance(bot_id)
+    bot = await db_run(get_bot_instance, bot_id)
     if not bot:
         msg = update.effective_message
         if msg:
@@ -342,7 +344,7 @@ async def _send_bot_info(update: Update, bot_id: str, show_full_token: bool = Fa
         await _send_chunks(update, "No user linked to this bot yet.")
         return
 
-    user = get_user_row(bot_id, int(owner_id))
+    user = await db_run(get_user_row, bot_id, int(owner_id))
     if not user:
         await _send_chunks(update, "User row not found for this bot.")
         return
@@ -375,7 +377,7 @@ async def _send_bot_info(update: Update, bot_id: str, show_full_token: bool = Fa
     filters_lines = ["", "⚙️ Filters"] + _render_filters(user.get("filters") or "{}")
     await _send_chunks(update, "\n".join(filters_lines))
 
-    classes_state = get_vehicle_classes_state(bot_id, int(owner_id))
+    classes_state = await db_run(get_vehicle_classes_state, bot_id, int(owner_id))
     classes_lines = [
         "",
         "🚗 Vehicle classes",
@@ -384,8 +386,8 @@ async def _send_bot_info(update: Update, bot_id: str, show_full_token: bool = Fa
     ]
     await _send_chunks(update, "\n".join(classes_lines))
 
-    days = get_blocked_days(bot_id, int(owner_id))
-    slots = get_booked_slots(bot_id, int(owner_id))
+    days = await db_run(get_blocked_days, bot_id, int(owner_id))
+    slots = await db_run(get_booked_slots, bot_id, int(owner_id))
     slot_parts = [f"{s['from']}->{s['to']}" for s in slots] if slots else []
     schedule_lines = [
         "",
@@ -395,7 +397,7 @@ async def _send_bot_info(update: Update, bot_id: str, show_full_token: bool = Fa
     ]
     await _send_chunks(update, "\n".join(schedule_lines))
 
-    custom_filters = list_user_custom_filters(bot_id, int(owner_id)) or []
+    custom_filters = await db_run(list_user_custom_filters, bot_id, int(owner_id)) or []
     cf_lines = ["", "🧩 Custom filters"]
     if custom_filters:
         for it in custom_filters:
@@ -407,7 +409,7 @@ async def _send_bot_info(update: Update, bot_id: str, show_full_token: bool = Fa
         cf_lines.append("—")
     await _send_chunks(update, "\n".join(cf_lines))
 
-    formulas = get_endtime_formulas(bot_id, int(owner_id)) or []
+    formulas = await db_run(get_endtime_formulas, bot_id, int(owner_id)) or []
     ef_lines = ["", "🧮 Endtime formulas"]
     if formulas:
         for f in formulas:
@@ -421,7 +423,7 @@ async def _send_bot_info(update: Update, bot_id: str, show_full_token: bool = Fa
 
 
 async def admin_bot_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not _admin_owner_ok(update, context):
+    if not await _admin_owner_ok(update, context):
         await update.message.reply_text("⛔ Not authorized.")
         return
     if not context.args:
@@ -443,7 +445,7 @@ async def admin_offers_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     if not query:
         return
-    if not _admin_owner_ok(update, context):
+    if not await _admin_owner_ok(update, context):
         await query.answer("Not authorized.", show_alert=True)
         return
     data = query.data or ""
@@ -458,10 +460,10 @@ async def admin_offers_callback(update: Update, context: ContextTypes.DEFAULT_TY
     target_user_id = int(parts[2])
     page = int(parts[3])
 
-    counts = get_offer_logs_counts(target_bot_id, target_user_id)
+    counts = await db_run(get_offer_logs_counts, target_bot_id, target_user_id)
     total = counts.get("total", 0)
     offset = page * _ADMIN_OFFERS_PAGE_SIZE
-    rows = get_offer_logs(target_bot_id, target_user_id, limit=_ADMIN_OFFERS_PAGE_SIZE, offset=offset)
+    rows = await db_run(get_offer_logs, target_bot_id, target_user_id, limit=_ADMIN_OFFERS_PAGE_SIZE, offset=offset)
 
     header = (
         f"📋 <b>Messages — {html.escape(target_bot_id)}</b>\n"
@@ -474,18 +476,18 @@ async def admin_offers_callback(update: Update, context: ContextTypes.DEFAULT_TY
     else:
         blocks = []
         for r in rows:
-            notify = (r.get("notify_text") or "").strip()
-            created = (r.get("created_at") or "")[:16]
-            status = r.get("status") or ""
+            notify = (r["notify_text"] or "").strip()
+            created = (r["created_at"] or "")[:16]
+            status = r["status"] or ""
             if notify:
                 blocks.append(f"<i>{html.escape(created)}</i>\n{html.escape(notify)}")
             else:
                 # Fallback for old entries without notify_text
                 icon = "✅" if status == "accepted" else ("⚠️" if status == "not_accepted" else "❌")
-                vc = html.escape(r.get("vehicle_class") or "—")
-                price = r.get("price")
+                vc = html.escape(r["vehicle_class"] or "—")
+                price = r["price"]
                 price_str = f" ${price}" if price else ""
-                reason = r.get("rejection_reason") or ""
+                reason = r["rejection_reason"] or ""
                 line = f"{icon} {vc}{price_str}"
                 if reason:
                     line += f"\n<i>{html.escape(reason)}</i>"
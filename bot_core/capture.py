@@ -1,12 +1,13 @@
-import threading
 from typing import Optional
 from telegram import Update
+from telegram.ext import ContextTypes
 
-from .identity import _try_update_bl_uuid
-from db import upsert_user_from_bot
+from .identity import _try_update_bl_uuid, _uuid_attempt_due
+from .storage import capture_user, db_run
 
 
-def _capture_from_update(update: Update, bot_id: Optional[str] = None):
+def _capture_from_update(update: Update, bot_id: Optional[str] = None) -> Optional[int]:
+    """Upsert the sender's profile; returns their id once stored."""
     try:
         u = update.effective_user
         c = update.effective_chat
@@ -26,11 +27,17 @@ def _capture_from_update(update: Update, bot_id: Optional[str] = None):
         )
         if not bot_id:
             return
-        upsert_user_from_bot(bot_id, user_d, chat_d)
-        try:
-            threading.Thread(target=_try_update_bl_uuid, args=(bot_id, u.id), daemon=True).start()
-        except Exception:
-            pass
+        capture_user(bot_id, user_d, chat_d)
+        return u.id
     except Exception:
         # don't interrupt UX if logging fails
-        pass
+        return None
+
+
+async def _capture(context: ContextTypes.DEFAULT_TYPE, update: Update, bot_id: Optional[str] = None):
+    user_id = await db_run(_capture_from_update, update, bot_id)
+    # The BL uuid lookup talks to the portal; run it as a task on the bot's
+    # loop (shared HTTP client) instead of holding up the update. The cooldown
+    # is checked here, so most updates don't create a task at all.
+    if user_id is not None and _uuid_attempt_due(bot_id, user_id):
+        context.application.create_task(_try_update_bl_uuid(bot_id, user_id))
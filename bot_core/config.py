@@ -36,6 +36,8 @@ ADMIN_BOT_TOKEN = os.getenv("ADMIN_BOT_TOKEN", "").strip()
 ADMIN_BOT_ID = os.getenv("ADMIN_BOT_ID", "").strip()
 ADMIN_BOT_NAME = os.getenv("ADMIN_BOT_NAME", "").strip()
 BOT_REFRESH_INTERVAL_S = int(os.getenv("BOT_REFRESH_INTERVAL_S", "20"))
+# Keep-alive connections per bot for Bot API calls (getUpdates has its own).
+BOT_HTTP_POOL_SIZE = int(os.getenv("BOT_HTTP_POOL_SIZE", "64"))
 MINI_APP_BASE = _ensure_https_base(os.getenv("MINI_APP_BASE", "http://localhost:3000"))
 BOOKED_SLOTS_URL = f"{MINI_APP_BASE}/booked-slots"
 SCHEDULE_URL = f"{MINI_APP_BASE}/schedule"
@@ -48,3 +50,10 @@ PORTAL_CLIENT_ID = os.getenv("BL_PORTAL_CLIENT_ID", "7qL5jGGai6MqBCatVeoihQx5dKE
 PORTAL_AUTH_BASE = os.getenv("PORTAL_AUTH_BASE", "https://athena.blacklane.com")
 PARTNER_PORTAL_API = os.getenv("PARTNER_PORTAL_API", "https://partner-portal-api.blacklane.com")
 P1_API_BASE = os.getenv("API_HOST", "https://chauffeur-app-api.blacklane.com")
+
+# Webhook transport (optional). When WEBHOOK_URL is set, bots receive updates on
+# <WEBHOOK_URL>/telegram/<bot_id> instead of long-polling getUpdates.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip().rstrip("/")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip()
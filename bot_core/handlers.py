@@ -1,14 +1,13 @@
-import json
+import asyncio
 import re
-from datetime import datetime
+import time
 from typing import Optional
 
-import requests
-from dateutil.tz import gettz
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ApplicationHandlerStop
+from telegram.helpers import escape_markdown
 
-from .capture import _capture_from_update
+from .capture import _capture
 from .menus import (
     build_main_menu,
     build_settings_menu,
@@ -31,40 +30,190 @@ from .menus import (
     build_flight_blacklist_menu,
     build_ends_dt_menu,
     build_stats_view,
+    PAGE_SIZE,
     build_stats_summary,
     build_all_filters_view,
     build_notifications_menu,
 )
-from .state import user_waiting_input, adding_slot_step, work_schedule_state, _ctx_bot_id, _state_key
-from .storage import get_active, set_active, get_filters
+from .state import FIELD_MAPPING, _ctx_bot_id
+from .storage import (
+    get_active,
+    set_active,
+    get_filters,
+    put_filters,
+    put_filter_values,
+    db_run,
+    invalidate_user,
+    warm_user,
+    get_blacklist_index,
+    extend_blacklist_index,
+    add_user,
+    add_blocked_day,
+    set_user_timezone,
+)
 from .utils import (
     parse_mobile_session_dump,
     validate_mobile_session,
     validate_datetime,
     validate_day,
+    validate_hhmm,
+    is_known_tz,
+    md_entities,
 )
 from db import (
-    add_user,
     assign_bot_owner,
     update_token,
-    update_filters,
     add_booked_slot,
-    get_blocked_days,
-    add_blocked_day,
     delete_blocked_day,
+    get_vehicle_classes_state,
     toggle_vehicle_class,
-    set_user_timezone,
     set_token_status,
     get_pinned_warnings,
-    clear_pinned_warning,
+    clear_pinned_warnings,
     get_notifications,
     set_notification,
     get_offer_message,
     get_bot_instance,
     get_token_auto_refresh,
     set_token_auto_refresh,
+    get_offer_logs_counts,
+    get_offer_logs,
+)
+
+# Fixed reply texts (shared by several branches)
+_MSG_SELECT_BOT = "Select a bot first with /listbots."
+_MSG_NOT_REGISTERED = "❌ Bot not registered. Please contact admin."
+_MSG_BAD_DATETIME = "❌ Format incorrect. Utilise `dd/mm/yyyy hh:mm`."
+_MSG_BAD_SPEED = "❌ Please send a float greater than 0 for *average speed (km/h)*."
+_MSG_BAD_BONUS = "❌ Please send a non-negative float for *bonus time (minutes)*."
+_MSG_BAD_HHMM = "❌ Please send time as `HH:MM` (e.g., `08:00`)."
+_MSG_BAD_POSFLOAT = "❌ Please send a float greater than 0 (e.g., `50`)."
+_MSG_BAD_DAY = "❌ Wrong format. Please send a date like `31/12/2025`."
+_MSG_BAD_TZ = "❌ Unknown timezone. Please send a valid IANA name like `America/Toronto`."
+# Fixed Markdown replies are pre-parsed to (text, entities) with md_entities()
+# and sent through _reply_static(), so Telegram never re-parses them.
+_MSG_EMPTY_BLACKLIST = md_entities("❌ Please send at least one value (e.g., `USA` or `USA, NYC`).")
+_MSG_SLOT_END_PROMPT = md_entities("📅 Send *end date/time* in format `dd/mm/yyyy hh:mm`:")
+_MSG_SLOT_NAME_PROMPT = md_entities("✏️ Optionally send a *name* for this slot, or type `-` to skip:")
+_MSG_BONUS_PROMPT = md_entities(
+    "⏱️ *Enter bonus time in minutes* (example: `60`)\n\n"
+    "_This is added to the estimated duration._"
 )
 
+_STATS_COUNTS_TTL_S = 10
+_WAITING_TTL_S = 30 * 60
+_WARM_INTERVAL_S = 10
+_WS_START_PROMPT = build_work_schedule_start_prompt()
+_WS_END_PROMPT = build_work_schedule_end_prompt()
+_WS_START_STATIC = md_entities(_WS_START_PROMPT[0])
+
+
+def _with_prompt(lead: str, prompt) -> tuple:
+    """(text, entities, keyboard) for a fixed line followed by a prebuilt prompt."""
+    text, entities = md_entities(f"{lead}\n\n{prompt[0]}")
+    return text, entities, prompt[1]
+
+
+# Work-schedule replies are fixed text around a fixed prompt: join and parse them once.
+_WS_BAD_START_REPLY = _with_prompt("❌ Invalid time. Please use `HH:MM` (e.g., `08:00`).", _WS_START_PROMPT)
+_WS_RETRY_START_REPLY = _with_prompt("⚠️ Let's try again. Please enter work START.", _WS_START_PROMPT)
+_WS_START_SAVED_REPLY = _with_prompt("✅ Start time saved.", _WS_END_PROMPT)
+_WS_BAD_END_REPLY = _with_prompt("❌ Invalid time. Please use `HH:MM` (e.g., `20:00`).", _WS_END_PROMPT)
+
+_BLACKLIST_INPUT_KEYS = {
+    "pickup_blacklist_add": "pickup_blacklist",
+    "dropoff_blacklist_add": "dropoff_blacklist",
+    "flight_blacklist_add": "flight_blacklist",
+}
+_BLACKLIST_MENUS = {
+    "pickup_blacklist": build_pickup_blacklist_menu,
+    "dropoff_blacklist": build_dropoff_blacklist_menu,
+    "flight_blacklist": build_flight_blacklist_menu,
+}
+_FLIGHT_NON_ALNUM_RE = re.compile(r"[^A-Za-z0-9]")
+_WS_RE = re.compile(r"\s+")
+_DECIMAL_RE = re.compile(r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)")
+
+
+def _norm_flight(s: str) -> str:
+    return _FLIGHT_NON_ALNUM_RE.sub("", s or "").upper()
+
+
+# Field names contain underscores; escape them for Markdown once, not per reply.
+_FIELD_LABELS_MD = {f: escape_markdown(f) for f in FIELD_MAPPING.values()}
+
+
+def _field_label_md(field: str) -> str:
+    return _FIELD_LABELS_MD.get(field) or escape_markdown(field)
+
+
+def _parse_float(text: str) -> Optional[float]:
+    # Plain decimals only: malformed input is rejected by the shape check
+    # instead of float() raising, and "inf"/"nan"/"1e9" never get through.
+    if not _DECIMAL_RE.fullmatch(text):
+        return None
+    return float(text)
+
+
+# Everything an open prompt needs lives in one user_data["prompt"] dict: the
+# awaited field, when it was asked, and whatever earlier steps of a multi-step
+# flow collected (ws_start, avg_speed, slot from/to). Finishing, replacing or
+# expiring a prompt is a single dict operation.
+def _set_waiting(user_data: dict, field: str, **state):
+    user_data["prompt"] = {"field": field, "ts": time.time(), **state}
+
+
+def _rearm(user_data: dict, prompt: dict):
+    """Put a prompt taken by handle_text back after rejected input."""
+    prompt["ts"] = time.time()
+    user_data["prompt"] = prompt
+
+
+def _waiting_field(user_data) -> Optional[str]:
+    prompt = (user_data or {}).get("prompt")
+    return prompt["field"] if prompt else None
+
+
+def _expire_waiting(user_data: dict):
+    # A prompt left unanswered for half an hour is abandoned; don't let it
+    # swallow whatever the user types next.
+    prompt = user_data.get("prompt")
+    if prompt and time.time() - prompt["ts"] > _WAITING_TTL_S:
+        del user_data["prompt"]
+
+
+def _fire(context: ContextTypes.DEFAULT_TYPE, coro):
+    """Run a Telegram call whose result nobody waits on; errors go to the app's error handling."""
+    return context.application.create_task(coro)
+
+
+def _reply_bg(context: ContextTypes.DEFAULT_TYPE, update: Update, text: str, **kwargs):
+    # The refreshed menu is the last thing a text handler does and nothing reads
+    # the sent Message back, so don't hold the update open for the round-trip.
+    _fire(context, update.message.reply_text(text, **kwargs))
+
+
+def _reply_static(message, static, **kwargs):
+    text, entities = static
+    return message.reply_text(text, entities=entities, **kwargs)
+
+
+def _reprompt(message, reply):
+    """Send a _with_prompt() reply: message and its prompt keyboard in one call."""
+    text, entities, menu = reply
+    return message.reply_text(text, entities=entities, reply_markup=menu)
+
+
+def _warm_soon(context: ContextTypes.DEFAULT_TYPE, bot_id: str, user_id: int):
+    # Users tap through several menus in a row: preload their state off the
+    # reply path, at most once per _WARM_INTERVAL_S.
+    user_data = context.user_data
+    now = time.time()
+    if now - user_data.get("warmed_ts", 0) < _WARM_INTERVAL_S:
+        return
+    user_data["warmed_ts"] = now
+    _fire(context, db_run(warm_user, bot_id, user_id))
+
 
 def _resolve_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
     app_bot_id = _ctx_bot_id(context)
@@ -78,27 +227,21 @@ def _resolve_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return app_bot_id, app_bot_id, update.effective_user.id, False
 
 
-def unpin_warning_if_any(bot_id: Optional[str], telegram_id: int, kind: str, bot_token: Optional[str] = None):
-    # kind: "no_token" | "expired"
-    if not bot_token or not bot_id:
+async def _unpin_token_warnings(bot, bot_id: str, telegram_id: int):
+    # Both token warnings (no_token / expired): one read, parallel unpins, one clear.
+    ids = await db_run(get_pinned_warnings, bot_id, telegram_id)
+    message_ids = [m for m in (ids["no_token_msg_id"], ids["expired_msg_id"]) if m]
+    if not message_ids:
         return
-    ids = get_pinned_warnings(bot_id, telegram_id)
-    message_id = ids["no_token_msg_id"] if kind == "no_token" else ids["expired_msg_id"]
-    if not message_id:
-        return
-    try:
-        requests.post(
-            f"https://api.telegram.org/bot{bot_token}/unpinChatMessage",
-            json={"chat_id": telegram_id, "message_id": message_id},
-            timeout=10,
-        )
-    except Exception:
-        pass
-    clear_pinned_warning(bot_id, telegram_id, kind)
+    await asyncio.gather(
+        *(bot.unpin_chat_message(chat_id=telegram_id, message_id=m) for m in message_ids),
+        return_exceptions=True,
+    )
+    await db_run(clear_pinned_warnings, bot_id, telegram_id)
 
 
 def _is_bearer_like(token: Optional[str]) -> bool:
-    return bool(token and isinstance(token, str) and token.lower().startswith("bearer "))
+    return bool(token and isinstance(token, str) and token[:7].lower() == "bearer ")
 
 
 def _validation_note_hint(note: str) -> str:
@@ -119,30 +262,32 @@ def _validation_note_hint(note: str) -> str:
     return "Saved but couldn't verify right now."
 
 
-def _save_mobile_input_for_user(
+async def _save_mobile_input_for_user(
     bot_id: str,
     user_id: int,
     raw: str,
-    bot_token: Optional[str] = None,
+    context: Optional[ContextTypes.DEFAULT_TYPE] = None,
 ) -> str:
     token_from_dump, headers_from_dump = parse_mobile_session_dump(raw)
     token_candidate = token_from_dump.strip() if _is_bearer_like(token_from_dump) else ""
     if not token_candidate or not headers_from_dump:
         return "❌ Invalid input. Send a full HTTP dump including Authorization + headers."
 
-    update_token(bot_id, user_id, token_candidate, headers=headers_from_dump, auth_meta={})
+    await db_run(update_token, bot_id, user_id, token_candidate, headers=headers_from_dump, auth_meta={})
 
-    ok, note = validate_mobile_session(token_candidate, headers_from_dump)
+    ok, note = await validate_mobile_session(token_candidate, headers_from_dump)
     if ok:
         next_status = "valid"
     elif note.startswith("unauthorized:401"):
         next_status = "expired"
     else:
         next_status = "unknown"
-    set_token_status(bot_id, user_id, next_status)
+    await db_run(set_token_status, bot_id, user_id, next_status)
+    invalidate_user(bot_id, user_id)
     if ok:
-        unpin_warning_if_any(bot_id, user_id, "no_token", bot_token)
-        unpin_warning_if_any(bot_id, user_id, "expired", bot_token)
+        if context is not None and bot_id:
+            # The reply doesn't depend on the unpins; let them finish in the background.
+            _fire(context, _unpin_token_warnings(context.bot, bot_id, user_id))
         return "✅ Mobile token + headers saved and validated."
     hint = _validation_note_hint(note)
     return f"⚠️ Token saved, validation failed ({note}). {hint}"
@@ -150,12 +295,12 @@ def _save_mobile_input_for_user(
 
 async def open_settings_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     app_bot_id, bot_id, user_id, admin_mode = _resolve_target(update, context)
-    _capture_from_update(update, app_bot_id)
+    await _capture(context, update, app_bot_id)
     if bot_id is None or user_id is None:
-        await update.message.reply_text("Select a bot first with /listbots.")
+        await update.message.reply_text(_MSG_SELECT_BOT)
         return
-    add_user(bot_id, user_id)
-    info_text, menu = build_settings_menu(user_id, bot_id, allow_tz_change=admin_mode, as_user_id=user_id)
+    await db_run(add_user, bot_id, user_id)
+    info_text, menu = await db_run(build_settings_menu, user_id, bot_id, allow_tz_change=admin_mode, as_user_id=user_id)
     await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
 
 
@@ -166,7 +311,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if role == "admin":
         if bot_id:
-            ok, reason = assign_bot_owner(bot_id, user_id)
+            ok, reason = await db_run(assign_bot_owner, bot_id, user_id)
             if not ok and reason == "bot_already_owned":
                 await update.message.reply_text("⛔ Admin bot is already assigned to another user.")
                 return
@@ -183,33 +328,34 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if not bot_id:
-        await update.message.reply_text("❌ Bot not registered. Please contact admin.")
+        await update.message.reply_text(_MSG_NOT_REGISTERED)
         return
 
-    ok, reason = assign_bot_owner(bot_id, user_id)
+    ok, reason = await db_run(assign_bot_owner, bot_id, user_id)
     if not ok:
         if reason == "bot_already_owned":
             await update.message.reply_text("⛔ This bot is already assigned to another user.")
         else:
-            await update.message.reply_text("❌ Bot not registered. Please contact admin.")
+            await update.message.reply_text(_MSG_NOT_REGISTERED)
         return
 
-    _capture_from_update(update, bot_id)
-    add_user(bot_id, user_id)
-    is_active = get_active(bot_id, user_id)
+    await _capture(context, update, bot_id)
+    await db_run(add_user, bot_id, user_id)
+    is_active = await db_run(get_active, bot_id, user_id)
     menu, status_text = build_main_menu(is_active)
     await update.message.reply_text(
         f"**Main menu**\n\nBot status: {status_text}\n\nChoose your action:",
         parse_mode="Markdown",
         reply_markup=menu,
     )
+    _warm_soon(context, bot_id, user_id)
 
 
 async def set_token(update: Update, context: ContextTypes.DEFAULT_TYPE):
     app_bot_id, bot_id, user_id, _admin_mode = _resolve_target(update, context)
-    _capture_from_update(update, app_bot_id)
+    await _capture(context, update, app_bot_id)
     if bot_id is None or user_id is None:
-        await update.message.reply_text("Select a bot first with /listbots.")
+        await update.message.reply_text(_MSG_SELECT_BOT)
         return
     message_text = (update.message.text or "") if update and update.message else ""
     raw = re.sub(r"(?is)^/token(?:@\w+)?\s*", "", message_text, count=1).strip()
@@ -222,333 +368,428 @@ async def set_token(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Accepted: full HTTP dump only (with Authorization + headers)."
         )
         return
-    bot_token = context.bot.token if context and context.bot else None
-    add_user(bot_id, user_id)
-    result_msg = _save_mobile_input_for_user(bot_id, user_id, raw, bot_token=bot_token)
-    await update.message.reply_text(result_msg)
+    await db_run(add_user, bot_id, user_id)
+    result_msg = await _save_mobile_input_for_user(bot_id, user_id, raw, context=context)
+    context.user_data.pop("stats_cache", None)
+    info_text, menu = await db_run(build_mobile_sessions_menu, bot_id, user_id)
+    await update.message.reply_text(
+        f"{escape_markdown(result_msg)}\n\n{info_text}", parse_mode="Markdown", reply_markup=menu
+    )
 
-    info_text, menu = build_mobile_sessions_menu(bot_id, user_id)
-    await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
 
+# ── Callback handlers ──────────────────────────────────────
+# Each takes (query, context, bot_id, user_id, admin_mode) with the target
+# already resolved by handle_buttons.
+async def _cb_set_active(query, context, bot_id: str, user_id: int, active: bool):
+    await db_run(set_active, bot_id, user_id, active)
+    context.user_data.pop("stats_cache", None)
+    menu, status_text = build_main_menu(active)
+    await query.edit_message_text(
+        f"**Main menu**\n\nBot status: {status_text}",
+        parse_mode="Markdown",
+        reply_markup=menu,
+    )
 
-async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    app_bot_id, bot_id, user_id, admin_mode = _resolve_target(update, context)
-    _capture_from_update(update, app_bot_id)
-    query = update.callback_query
-    await query.answer()
-    if bot_id is None or user_id is None:
-        await query.edit_message_text("Select a bot first with /listbots.", parse_mode="Markdown")
-        return
-    state_key = _state_key(bot_id, user_id)
 
-    # Activate / Deactivate
-    if query.data == "activate":
-        set_active(bot_id, user_id, True)
-        menu, status_text = build_main_menu(True)
-        await query.edit_message_text(
-            f"**Main menu**\n\nBot status: {status_text}",
-            parse_mode="Markdown",
-            reply_markup=menu,
-        )
-        return
-    if query.data == "deactivate":
-        set_active(bot_id, user_id, False)
-        menu, status_text = build_main_menu(False)
-        await query.edit_message_text(
-            f"**Main menu**\n\nBot status: {status_text}",
-            parse_mode="Markdown",
-            reply_markup=menu,
-        )
-        return
+async def _cb_activate(query, context, bot_id, user_id, admin_mode):
+    await _cb_set_active(query, context, bot_id, user_id, True)
 
-    # Settings
-    if query.data == "settings":
-        info_text, menu = build_settings_menu(user_id, bot_id, allow_tz_change=admin_mode, as_user_id=user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
-    if query.data == "change_tz":
-        if not admin_mode:
-            await query.edit_message_text(
-                "🌍 Timezone is managed by the admin for this bot.",
-                parse_mode="Markdown",
-            )
-            return
-        user_waiting_input[state_key] = "set_timezone"
+
+async def _cb_deactivate(query, context, bot_id, user_id, admin_mode):
+    await _cb_set_active(query, context, bot_id, user_id, False)
+
+
+async def _cb_settings(query, context, bot_id, user_id, admin_mode):
+    info_text, menu = await db_run(build_settings_menu, user_id, bot_id, allow_tz_change=admin_mode, as_user_id=user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+
+async def _cb_change_tz(query, context, bot_id, user_id, admin_mode):
+    if not admin_mode:
         await query.edit_message_text(
-            "🌍 *Send timezone* as IANA name (e.g., `Africa/Casablanca`, `America/Toronto`).",
-            parse_mode="Markdown",
+            "🌍 Timezone is managed by the admin for this bot.",
         )
         return
+    _set_waiting(context.user_data, "set_timezone")
+    await query.edit_message_text(
+        "🌍 *Send timezone* as IANA name (e.g., `Africa/Casablanca`, `America/Toronto`).",
+        parse_mode="Markdown",
+    )
 
-    if query.data == "notifications":
-        info_text, menu = build_notifications_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
 
-    if query.data.startswith("toggle_n:"):
-        kind = query.data.split(":", 1)[1]
-        prefs = get_notifications(bot_id, user_id)
-        new_val = not prefs.get(kind, True)
-        set_notification(bot_id, user_id, kind, new_val)
-        info_text, menu = build_notifications_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
+async def _cb_notifications(query, context, bot_id, user_id, admin_mode):
+    info_text, menu = await db_run(build_notifications_menu, bot_id, user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
 
-    if query.data == "toggle_auto_refresh":
-        current = get_token_auto_refresh(bot_id, user_id)
-        set_token_auto_refresh(bot_id, user_id, not current)
-        info_text, menu = build_settings_menu(user_id, bot_id, allow_tz_change=admin_mode, as_user_id=user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
 
-    # Mobile sessions
-    if query.data == "mobile_sessions":
-        add_user(bot_id, user_id)
-        info_text, menu = build_mobile_sessions_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
-    if query.data in ("add_mobile_session", "open_mobile_sessions"):
-        add_user(bot_id, user_id)
-        user_waiting_input[state_key] = "set_token"
-        await query.answer()
-        await query.message.reply_text(
-            "🔑 *Send full HTTP dump*\n\n"
-            "Accepted only:\n"
-            "• full HTTP request dump with `Authorization: Bearer ...`\n"
-            "• includes all request headers",
-            parse_mode="Markdown",
-        )
-        return
-    if query.data == "show_all_filters":
-        info_text, menu = build_all_filters_view(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="HTML", reply_markup=menu)
-        return
+async def _cb_toggle_notification(query, context, bot_id, user_id, admin_mode):
+    kind = query.data.split(":", 1)[1]
+    prefs = await db_run(get_notifications, bot_id, user_id)
+    new_val = not prefs.get(kind, True)
+    await db_run(set_notification, bot_id, user_id, kind, new_val)
+    invalidate_user(bot_id, user_id)
+    info_text, menu = await db_run(build_notifications_menu, bot_id, user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
 
-    if query.data.startswith("show_offer:"):
-        key = query.data.split(":", 1)[1]
-        header, full = get_offer_message(bot_id, user_id, key)
-        if not full:
-            await query.edit_message_text(
-                "No details available for this offer.",
-                parse_mode="HTML",
-            )
-            return
-        kb = InlineKeyboardMarkup([[InlineKeyboardButton("Hide details", callback_data=f"hide_offer:{key}")]])
-        await query.edit_message_text(full, parse_mode="HTML", reply_markup=kb)
-        return
 
-    if query.data.startswith("hide_offer:"):
-        key = query.data.split(":", 1)[1]
-        header, full = get_offer_message(bot_id, user_id, key)
-        if not header:
-            header = "Details hidden."
-        kb = InlineKeyboardMarkup([[InlineKeyboardButton("Show details", callback_data=f"show_offer:{key}")]])
-        await query.edit_message_text(header, parse_mode="HTML", reply_markup=kb)
-        return
+async def _cb_toggle_auto_refresh(query, context, bot_id, user_id, admin_mode):
+    current = await db_run(get_token_auto_refresh, bot_id, user_id)
+    await db_run(set_token_auto_refresh, bot_id, user_id, not current)
+    invalidate_user(bot_id, user_id)
+    info_text, menu = await db_run(build_settings_menu, user_id, bot_id, allow_tz_change=admin_mode, as_user_id=user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
 
-    # Stats
-    if query.data == "statistic":
-        info_text, menu = build_stats_summary(bot_id, user_id, range_key="today")
-        await query.edit_message_text(info_text, parse_mode="HTML", reply_markup=menu)
-        return
-    if query.data.startswith("stats_range:"):
-        range_key = query.data.split(":", 1)[1]
-        info_text, menu = build_stats_summary(bot_id, user_id, range_key=range_key)
-        await query.edit_message_text(info_text, parse_mode="HTML", reply_markup=menu)
-        return
-    if query.data == "checked_statistic":
-        info_text, menu = build_stats_view(bot_id, user_id, page=0)
-        await query.edit_message_text(info_text, parse_mode="HTML", reply_markup=menu)
-        return
-    if query.data.startswith("stats_page:"):
-        try:
-            page = int(query.data.split(":")[1])
-        except Exception:
-            page = 0
-        info_text, menu = build_stats_view(bot_id, user_id, page=page)
-        await query.edit_message_text(info_text, parse_mode="HTML", reply_markup=menu)
-        return
 
-    # Filters menu & back
-    if query.data in ("filters", "back_to_filters"):
-        info_text, menu = build_filters_menu(get_filters(bot_id, user_id), user_id, bot_id, as_user_id=user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
-    if query.data == "back_to_main":
-        menu, status_text = build_main_menu(get_active(bot_id, user_id))
-        await query.edit_message_text(
-            f"**Main menu**\n\nBot status: {status_text}",
-            parse_mode="Markdown",
-            reply_markup=menu,
-        )
-        return
+async def _cb_mobile_sessions(query, context, bot_id, user_id, admin_mode):
+    await db_run(add_user, bot_id, user_id)
+    info_text, menu = await db_run(build_mobile_sessions_menu, bot_id, user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
 
-    # Show filters summary
-    if query.data == "show_filters":
-        info_text, menu = build_filters_menu(get_filters(bot_id, user_id), user_id, bot_id, as_user_id=user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
 
-    # Gap
-    if query.data == "change_gap":
-        info_text, menu = build_gap_input_menu()
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        user_waiting_input[state_key] = "gap"
-        return
+async def _cb_add_mobile_session(query, context, bot_id, user_id, admin_mode):
+    await db_run(add_user, bot_id, user_id)
+    _set_waiting(context.user_data, "set_token")
+    await query.answer()
+    await query.message.reply_text(
+        "🔑 *Send full HTTP dump*\n\n"
+        "Accepted only:\n"
+        "• full HTTP request dump with `Authorization: Bearer ...`\n"
+        "• includes all request headers",
+        parse_mode="Markdown",
+    )
 
-    # Min / Max price
-    if query.data == "change_price_min":
-        user_waiting_input[state_key] = "price_min"
-        info_text, menu = build_min_price_input_menu()
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
-    if query.data == "change_price_max":
-        user_waiting_input[state_key] = "price_max"
-        info_text, menu = build_max_price_input_menu()
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
 
-    # Work schedule submenu & flow
-    if query.data == "work_schedule":
-        info_text, menu = build_work_schedule_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
-    if query.data == "update_work_schedule":
-        user_waiting_input[state_key] = "work_schedule_start"
-        work_schedule_state[state_key] = {}
-        info_text, menu = build_work_schedule_start_prompt()
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
+async def _cb_show_all_filters(query, context, bot_id, user_id, admin_mode):
+    info_text, menu = await db_run(build_all_filters_view, bot_id, user_id)
+    await query.edit_message_text(info_text, parse_mode="HTML", reply_markup=menu)
 
-    # Min duration
-    if query.data == "change_min_duration":
-        info_text, menu = build_min_duration_input_menu()
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        user_waiting_input[state_key] = "min_duration"
-        return
 
-    # Schedule (blocked days)
-    if query.data == "schedule":
-        info_text, menu = build_schedule_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
-    if query.data == "add_blocked_day":
-        user_waiting_input[state_key] = "add_blocked_day"
+async def _cb_show_offer(query, context, bot_id, user_id, admin_mode):
+    key = query.data.split(":", 1)[1]
+    header, full = await db_run(get_offer_message, bot_id, user_id, key)
+    if not full:
         await query.edit_message_text(
-            "📅 *Enter a day to block* in format `dd/mm/yyyy` (e.g., `31/12/2025`).",
-            parse_mode="Markdown",
+            "No details available for this offer.",
+            parse_mode="HTML",
         )
         return
-    if query.data.startswith("delete_day_"):
-        try:
-            day_id = int(query.data.split("_")[-1])
-            delete_blocked_day(bot_id, day_id)
-        except Exception:
-            pass
-        info_text, menu = build_schedule_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
+    kb = InlineKeyboardMarkup([[InlineKeyboardButton("Hide details", callback_data=f"hide_offer:{key}")]])
+    await query.edit_message_text(full, parse_mode="HTML", reply_markup=kb)
 
-    # Change classes
-    if query.data == "change_classes":
-        info_text, menu = build_classes_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
 
-    # Toggle vehicle classes
-    if query.data.startswith("toggle_transfer_") or query.data.startswith("toggle_hourly_"):
-        parts = query.data.split("_")
-        ttype = parts[1]
-        vclass = parts[2]
-        toggle_vehicle_class(bot_id, user_id, ttype, vclass)
-        info_text, menu = build_classes_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
+async def _cb_hide_offer(query, context, bot_id, user_id, admin_mode):
+    key = query.data.split(":", 1)[1]
+    header, full = await db_run(get_offer_message, bot_id, user_id, key)
+    if not header:
+        header = "Details hidden."
+    kb = InlineKeyboardMarkup([[InlineKeyboardButton("Show details", callback_data=f"show_offer:{key}")]])
+    await query.edit_message_text(header, parse_mode="HTML", reply_markup=kb)
 
-    # Blacklists
-    if query.data == "pickup_blacklist":
-        info_text, menu = build_pickup_blacklist_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
-    if query.data == "dropoff_blacklist":
-        info_text, menu = build_dropoff_blacklist_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
-    if query.data == "flight_blacklist":
-        info_text, menu = build_flight_blacklist_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
-    if query.data == "add_pickup_blacklist":
-        user_waiting_input[state_key] = "pickup_blacklist_add"
-        await query.edit_message_text(
-            "✏️ *Send pickup blacklist terms*\n"
-            "• One per message (e.g., `USA`)\n"
-            "• Or multiple separated by commas (e.g., `USA, NYC, Boston`)",
-            parse_mode="Markdown",
-        )
-        return
-    if query.data == "add_dropoff_blacklist":
-        user_waiting_input[state_key] = "dropoff_blacklist_add"
-        await query.edit_message_text(
-            "✏️ *Send dropoff blacklist terms*\n"
-            "• One per message (e.g., `USA`)\n"
-            "• Or multiple separated by commas (e.g., `USA, NYC, Boston`)",
-            parse_mode="Markdown",
-        )
-        return
-    if query.data == "add_flight_blacklist":
-        user_waiting_input[state_key] = "flight_blacklist_add"
-        await query.edit_message_text(
-            "✏️ *Send flight numbers to block*\n"
-            "• One per message (e.g., `EK 243`)\n"
-            "• Or multiple separated by commas (e.g., `EK 243, BA 002`)",
-            parse_mode="Markdown",
-        )
-        return
-    if query.data.startswith("delete_flight_blacklist:"):
-        try:
-            idx = int(query.data.split(":", 1)[1])
-            filters_data = get_filters(bot_id, user_id)
-            current = filters_data.get("flight_blacklist") or []
-            if 0 <= idx < len(current):
-                removed = current.pop(idx)
-                filters_data["flight_blacklist"] = current
-                update_filters(bot_id, user_id, json.dumps(filters_data))
-                await query.answer(f"✅ '{removed}' removed.", show_alert=False)
-            else:
-                await query.answer("⚠️ Entry not found.", show_alert=False)
-        except Exception:
-            await query.answer("❌ Error.", show_alert=False)
-        info_text, menu = build_flight_blacklist_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
 
-    # Ends datetime callbacks
-    if query.data == "ends_dt":
-        info_text, menu = build_ends_dt_menu(bot_id, user_id)
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
-    if query.data == "update_ends_dt":
-        user_waiting_input[state_key] = "avg_speed_kmh"
-        await query.edit_message_text(
-            "🚗 *Enter average speed in km/h* (example: `50`)\n\n"
-            "_This will be used to estimate ride end time._",
-            parse_mode="Markdown",
+async def _cb_statistic(query, context, bot_id, user_id, admin_mode):
+    info_text, menu = await db_run(build_stats_summary, bot_id, user_id, range_key="today")
+    await query.edit_message_text(info_text, parse_mode="HTML", reply_markup=menu)
+
+
+async def _cb_stats_range(query, context, bot_id, user_id, admin_mode):
+    range_key = query.data.split(":", 1)[1]
+    info_text, menu = await db_run(build_stats_summary, bot_id, user_id, range_key=range_key)
+    await query.edit_message_text(info_text, parse_mode="HTML", reply_markup=menu)
+
+
+async def _stats_counts(context, bot_id: str, user_id: int, refresh: bool = False) -> dict:
+    # Counts only move when the poller logs a new offer; page flips within
+    # a few seconds reuse the last result and only fetch the page rows.
+    now = time.time()
+    cached = context.user_data.get("stats_counts")
+    if not refresh and cached and cached[0] == (bot_id, user_id) and now - cached[1] < _STATS_COUNTS_TTL_S:
+        return cached[2]
+    counts = await db_run(get_offer_logs_counts, bot_id, user_id)
+    context.user_data["stats_counts"] = ((bot_id, user_id), now, counts)
+    return counts
+
+
+async def _stats_page(context, bot_id: str, user_id: int, page: int, counts: dict, rows: Optional[list] = None):
+    # Rendered pages are keyed on the counts: while nothing new was logged the
+    # same page renders identically, so skip the row query and formatting.
+    key = (
+        bot_id, user_id, page,
+        counts.get("total"), counts.get("accepted"), counts.get("rejected"), counts.get("not_accepted"),
+    )
+    cached = context.user_data.get("stats_cache")
+    if cached and cached[0] == key:
+        return cached[1]
+    rendered = await db_run(build_stats_view, bot_id, user_id, page=page, counts=counts, rows=rows)
+    context.user_data["stats_cache"] = (key, rendered)
+    return rendered
+
+
+async def _cb_checked_statistic(query, context, bot_id, user_id, admin_mode):
+    cached = context.user_data.get("stats_cache")
+    if cached and cached[0][:3] == (bot_id, user_id, 0):
+        # A page-0 render may still be current: check the fresh counts against
+        # it first and only read rows if they moved.
+        counts = await _stats_counts(context, bot_id, user_id, refresh=True)
+        info_text, menu = await _stats_page(context, bot_id, user_id, 0, counts)
+    else:
+        # Nothing to reuse; read the first page alongside the counts
+        # (get_offer_logs uses its own connection, so the two reads overlap).
+        counts, rows = await asyncio.gather(
+            _stats_counts(context, bot_id, user_id, refresh=True),
+            db_run(get_offer_logs, bot_id, user_id, limit=PAGE_SIZE, offset=0),
         )
-        return
+        info_text, menu = await _stats_page(context, bot_id, user_id, 0, counts, rows=rows)
+    await query.edit_message_text(info_text, parse_mode="HTML", reply_markup=menu)
 
-    # KM changes
-    if query.data == "change_min_km":
-        user_waiting_input[state_key] = "min_km"
-        info_text, menu = build_min_km_input_menu()
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        return
-    if query.data == "change_max_km":
-        user_waiting_input[state_key] = "max_km"
-        info_text, menu = build_max_km_input_menu()
-        await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+async def _cb_stats_page(query, context, bot_id, user_id, admin_mode):
+    try:
+        page = int(query.data.split(":")[1])
+    except (IndexError, ValueError):
+        page = 0
+    counts = await _stats_counts(context, bot_id, user_id)
+    info_text, menu = await _stats_page(context, bot_id, user_id, page, counts)
+    await query.edit_message_text(info_text, parse_mode="HTML", reply_markup=menu)
+
+
+async def _cb_filters(query, context, bot_id, user_id, admin_mode):
+    filters_data = await db_run(get_filters, bot_id, user_id)
+    info_text, menu = build_filters_menu(filters_data, user_id, bot_id, as_user_id=user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+
+async def _cb_back_to_main(query, context, bot_id, user_id, admin_mode):
+    menu, status_text = build_main_menu(await db_run(get_active, bot_id, user_id))
+    await query.edit_message_text(
+        f"**Main menu**\n\nBot status: {status_text}",
+        parse_mode="Markdown",
+        reply_markup=menu,
+    )
+
+
+def _cb_prompt(field: str, build_prompt):
+    """Callback that shows a static input prompt and waits for `field`."""
+    info_text, menu = build_prompt()  # static: build and parse once when the table is made
+    text, entities = md_entities(info_text)
+
+    async def _handler(query, context, bot_id, user_id, admin_mode):
+        _set_waiting(context.user_data, field)
+        await query.edit_message_text(text, entities=entities, reply_markup=menu)
+    return _handler
+
+
+async def _cb_work_schedule(query, context, bot_id, user_id, admin_mode):
+    info_text, menu = await db_run(build_work_schedule_menu, bot_id, user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+
+async def _cb_update_work_schedule(query, context, bot_id, user_id, admin_mode):
+    _set_waiting(context.user_data, "work_schedule_start")
+    text, entities = _WS_START_STATIC
+    await query.edit_message_text(text, entities=entities, reply_markup=_WS_START_PROMPT[1])
+
+
+async def _cb_schedule(query, context, bot_id, user_id, admin_mode):
+    info_text, menu = await db_run(build_schedule_menu, bot_id, user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+
+async def _cb_add_blocked_day(query, context, bot_id, user_id, admin_mode):
+    _set_waiting(context.user_data, "add_blocked_day")
+    await query.edit_message_text(
+        "📅 *Enter a day to block* in format `dd/mm/yyyy` (e.g., `31/12/2025`).",
+        parse_mode="Markdown",
+    )
+
+
+async def _cb_delete_day(query, context, bot_id, user_id, admin_mode):
+    try:
+        day_id = int(query.data.split("_")[-1])
+        await db_run(delete_blocked_day, bot_id, day_id)
+    except Exception:
+        pass
+    info_text, menu = await db_run(build_schedule_menu, bot_id, user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+
+async def _vclasses_state(context, bot_id, user_id, refresh: bool = False) -> dict:
+    """Class toggles for the open classes menu; read once on entry, then patched per toggle."""
+    key = (bot_id, user_id)
+    cached = context.user_data.get("vclasses")
+    if not refresh and cached and cached[0] == key:
+        return cached[1]
+    state = await db_run(get_vehicle_classes_state, bot_id, user_id)
+    context.user_data["vclasses"] = (key, state)
+    return state
+
+
+async def _cb_change_classes(query, context, bot_id, user_id, admin_mode):
+    state = await _vclasses_state(context, bot_id, user_id, refresh=True)
+    info_text, menu = build_classes_menu(bot_id, user_id, state=state)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+
+async def _cb_toggle_class(query, context, bot_id, user_id, admin_mode):
+    parts = query.data.split("_")
+    ttype = parts[1]
+    vclass = parts[2]
+    new_val = await db_run(toggle_vehicle_class, bot_id, user_id, ttype, vclass)
+    state = await _vclasses_state(context, bot_id, user_id, refresh=new_val is None)
+    if new_val is not None:
+        state.setdefault(ttype, {})[vclass] = new_val
+    info_text, menu = build_classes_menu(bot_id, user_id, state=state)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+
+async def _cb_pickup_blacklist(query, context, bot_id, user_id, admin_mode):
+    info_text, menu = await db_run(build_pickup_blacklist_menu, bot_id, user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+
+async def _cb_dropoff_blacklist(query, context, bot_id, user_id, admin_mode):
+    info_text, menu = await db_run(build_dropoff_blacklist_menu, bot_id, user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+
+async def _cb_flight_blacklist(query, context, bot_id, user_id, admin_mode):
+    info_text, menu = await db_run(build_flight_blacklist_menu, bot_id, user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+
+def _cb_text_prompt(field: str, text: str):
+    """Callback that replaces the message with a plain prompt and waits for `field`."""
+    plain, entities = md_entities(text)
+
+    async def _handler(query, context, bot_id, user_id, admin_mode):
+        _set_waiting(context.user_data, field)
+        await query.edit_message_text(plain, entities=entities)
+    return _handler
+
+
+async def _cb_delete_flight_blacklist(query, context, bot_id, user_id, admin_mode):
+    filters_data = None
+    try:
+        idx = int(query.data.split(":", 1)[1])
+        filters_data = await db_run(get_filters, bot_id, user_id)
+        current = filters_data.get("flight_blacklist") or []
+        if 0 <= idx < len(current):
+            removed = current.pop(idx)
+            filters_data["flight_blacklist"] = current
+            await db_run(put_filters, bot_id, user_id, filters_data)
+            await query.answer(f"✅ '{removed}' removed.", show_alert=False)
+        else:
+            await query.answer("⚠️ Entry not found.", show_alert=False)
+    except Exception:
+        # the pop may not have been saved: let the menu re-read the stored list
+        filters_data = None
+        await query.answer("❌ Error.", show_alert=False)
+    info_text, menu = await db_run(build_flight_blacklist_menu, bot_id, user_id, filters_data=filters_data)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+
+async def _cb_ends_dt(query, context, bot_id, user_id, admin_mode):
+    info_text, menu = await db_run(build_ends_dt_menu, bot_id, user_id)
+    await query.edit_message_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+
+_CB_HANDLERS = {
+    "activate": _cb_activate,
+    "deactivate": _cb_deactivate,
+    "settings": _cb_settings,
+    "change_tz": _cb_change_tz,
+    "notifications": _cb_notifications,
+    "toggle_auto_refresh": _cb_toggle_auto_refresh,
+    "mobile_sessions": _cb_mobile_sessions,
+    "add_mobile_session": _cb_add_mobile_session,
+    "open_mobile_sessions": _cb_add_mobile_session,
+    "show_all_filters": _cb_show_all_filters,
+    "statistic": _cb_statistic,
+    "checked_statistic": _cb_checked_statistic,
+    "filters": _cb_filters,
+    "back_to_filters": _cb_filters,
+    "show_filters": _cb_filters,
+    "back_to_main": _cb_back_to_main,
+    "change_gap": _cb_prompt("gap", build_gap_input_menu),
+    "change_price_min": _cb_prompt("price_min", build_min_price_input_menu),
+    "change_price_max": _cb_prompt("price_max", build_max_price_input_menu),
+    "change_min_duration": _cb_prompt("min_duration", build_min_duration_input_menu),
+    "change_min_km": _cb_prompt("min_km", build_min_km_input_menu),
+    "change_max_km": _cb_prompt("max_km", build_max_km_input_menu),
+    "work_schedule": _cb_work_schedule,
+    "update_work_schedule": _cb_update_work_schedule,
+    "schedule": _cb_schedule,
+    "add_blocked_day": _cb_add_blocked_day,
+    "change_classes": _cb_change_classes,
+    "pickup_blacklist": _cb_pickup_blacklist,
+    "dropoff_blacklist": _cb_dropoff_blacklist,
+    "flight_blacklist": _cb_flight_blacklist,
+    "add_pickup_blacklist": _cb_text_prompt(
+        "pickup_blacklist_add",
+        "✏️ *Send pickup blacklist terms*\n"
+        "• One per message (e.g., `USA`)\n"
+        "• Or multiple separated by commas (e.g., `USA, NYC, Boston`)",
+    ),
+    "add_dropoff_blacklist": _cb_text_prompt(
+        "dropoff_blacklist_add",
+        "✏️ *Send dropoff blacklist terms*\n"
+        "• One per message (e.g., `USA`)\n"
+        "• Or multiple separated by commas (e.g., `USA, NYC, Boston`)",
+    ),
+    "add_flight_blacklist": _cb_text_prompt(
+        "flight_blacklist_add",
+        "✏️ *Send flight numbers to block*\n"
+        "• One per message (e.g., `EK 243`)\n"
+        "• Or multiple separated by commas (e.g., `EK 243, BA 002`)",
+    ),
+    "ends_dt": _cb_ends_dt,
+    "update_ends_dt": _cb_text_prompt(
+        "avg_speed_kmh",
+        "🚗 *Enter average speed in km/h* (example: `50`)\n\n"
+        "_This will be used to estimate ride end time._",
+    ),
+}
+
+# "<name>:<arg>" callbacks, keyed by the part before the colon.
+_CB_ARG_HANDLERS = {
+    "toggle_n": _cb_toggle_notification,
+    "show_offer": _cb_show_offer,
+    "hide_offer": _cb_hide_offer,
+    "stats_range": _cb_stats_range,
+    "stats_page": _cb_stats_page,
+    "delete_flight_blacklist": _cb_delete_flight_blacklist,
+}
+
+# "<name>_<arg>" callbacks; one regex match picks the name.
+_CB_PREFIX_HANDLERS = {
+    "delete_day": _cb_delete_day,
+    "toggle_transfer": _cb_toggle_class,
+    "toggle_hourly": _cb_toggle_class,
+}
+_CB_PREFIX_RE = re.compile(r"(delete_day|toggle_transfer|toggle_hourly)_")
+
+
+async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    app_bot_id, bot_id, user_id, admin_mode = _resolve_target(update, context)
+    query = update.callback_query
+    # Ack the button spinner while the DB work below runs.
+    _fire(context, query.answer())
+    await _capture(context, update, app_bot_id)
+    if bot_id is None or user_id is None:
+        await query.edit_message_text(_MSG_SELECT_BOT)
         return
 
+    data = query.data or ""
+    handler = _CB_HANDLERS.get(data)
+    if handler is None and ":" in data:
+        handler = _CB_ARG_HANDLERS.get(data.split(":", 1)[0])
+    if handler is None:
+        m = _CB_PREFIX_RE.match(data)
+        if m:
+            handler = _CB_PREFIX_HANDLERS[m.group(1)]
+    if handler is not None:
+        await handler(query, context, bot_id, user_id, admin_mode)
+    _warm_soon(context, bot_id, user_id)
+
 
 async def _tap_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     role = (context.application.bot_data or {}).get("role", "user")
@@ -561,7 +802,7 @@ async def _tap_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user or not bot_id:
         return
 
-    bot = get_bot_instance(bot_id)
+    bot = await db_run(get_bot_instance, bot_id)
     owner_id = bot.get("owner_telegram_id") if bot else None
 
     is_start = bool(update.message and (update.message.text or "").strip().startswith("/start"))
@@ -581,285 +822,291 @@ async def _tap_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
         is_token_recovery_cb = cb_data in ("open_mobile_sessions", "add_mobile_session")
         chat_id = getattr(update.effective_chat, "id", None)
         is_private_chat = chat_id is not None and int(chat_id) == int(user.id)
-        state_key = _state_key(bot_id, int(user.id))
-        is_awaiting_token = user_waiting_input.get(state_key) == "set_token"
+        is_awaiting_token = _waiting_field(context.user_data) == "set_token"
         if is_private_chat and (is_token_recovery_cb or is_awaiting_token):
-            _capture_from_update(update, bot_id)
+            await _capture(context, update, bot_id)
             return
         raise ApplicationHandlerStop
 
-    _capture_from_update(update, bot_id)
+    await _capture(context, update, bot_id)
 
 
-async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    app_bot_id, bot_id, user_id, admin_mode = _resolve_target(update, context)
-    _capture_from_update(update, app_bot_id)
-    if bot_id is None or user_id is None:
-        await update.message.reply_text("Select a bot first with /listbots.")
+# ── Text input handlers ─────────────────────────────────────
+# One coroutine per awaited field, dispatched from handle_text through
+# _FIELD_HANDLERS (mirrors _CB_HANDLERS for buttons).
+async def _in_blocked_day(update, context, bot_id, user_id, prompt, text):
+    if not validate_day(text):
+        await update.message.reply_text(_MSG_BAD_DAY)
+        return
+    # blocked_days is UNIQUE per (bot, user, day): the insert itself is the membership test.
+    if await db_run(add_blocked_day, bot_id, user_id, text):
+        confirm = f"✅ Day `{text}` added to blocked days."
+    else:
+        confirm = f"ℹ️ `{text}` is already blocked."
+    info_text, menu = await db_run(build_schedule_menu, bot_id, user_id)
+    _reply_bg(context, update, f"{confirm}\n\n{info_text}", parse_mode="Markdown", reply_markup=menu)
+
+
+async def _in_blacklist(update, context, bot_id, user_id, prompt, text):
+    """Add to a blacklist (single value or comma-separated list)."""
+    key = _BLACKLIST_INPUT_KEYS[prompt["field"]]
+    items = [p for p in map(str.strip, text.split(",")) if p]
+    if not items:
+        await _reply_static(update.message, _MSG_EMPTY_BLACKLIST)
+        _rearm(context.user_data, prompt)
         return
-    state_key = _state_key(bot_id, user_id)
-    text = update.message.text.strip()
 
-    if user_waiting_input.get(state_key) == "set_timezone":
-        tz = text.strip()
-        if tz.upper() not in ("UTC", "GMT") and gettz(tz) is None:
-            await update.message.reply_text("❌ Unknown timezone. Please send a valid IANA name like `America/Toronto`.")
-            return
-        set_user_timezone(bot_id, user_id, tz)
-        await update.message.reply_text(f"✅ Timezone set to `{tz}`.", parse_mode="Markdown")
-        info_text, menu = build_settings_menu(user_id, bot_id, allow_tz_change=admin_mode, as_user_id=user_id)
-        await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        user_waiting_input.pop(state_key, None)
+    filters_data = await db_run(get_filters, bot_id, user_id)
+    current = filters_data.get(key, []) or []
+
+    # The normalised index persists across messages; each new item is an O(1) lookup.
+    # New entries collect in `pending` and only join the index once saved.
+    is_flight = key == "flight_blacklist"
+    index = get_blacklist_index(bot_id, user_id, key, current, _norm_flight if is_flight else str.lower)
+    pending: set = set()
+    added, skipped = [], []
+    if is_flight:
+        for item in items:
+            norm = _norm_flight(item)
+            if not norm:
+                continue
+            disp = _WS_RE.sub(" ", item).upper()  # items are already stripped
+            if norm in index or norm in pending:
+                skipped.append(disp)
+            else:
+                current.append(disp)
+                pending.add(norm)
+                added.append(disp)
+    else:
+        for item in items:
+            lowered = item.lower()
+            if lowered in index or lowered in pending:
+                skipped.append(item)
+            else:
+                current.append(item)
+                pending.add(lowered)
+                added.append(item)
+
+    if added:
+        filters_data[key] = current
+        await db_run(put_filters, bot_id, user_id, filters_data)
+        extend_blacklist_index(bot_id, user_id, key, index, pending)
+
+    msg_lines = []
+    if added:
+        msg_lines.append("✅ Added: " + ", ".join(f"`{a}`" for a in added))
+    if skipped:
+        msg_lines.append("ℹ️ Already present: " + ", ".join(f"`{s}`" for s in skipped))
+    confirm = "\n".join(msg_lines) if msg_lines else "Nothing to add."
+
+    info_text, menu = _BLACKLIST_MENUS[key](bot_id, user_id, filters_data=filters_data)
+    _reply_bg(context, update, f"{confirm}\n\n{info_text}", parse_mode="Markdown", reply_markup=menu)
+
+
+async def _in_avg_speed(update, context, bot_id, user_id, prompt, text):
+    """Ends datetime step 1 (speed)."""
+    speed = _parse_float(text)
+    if speed is None or speed <= 0:
+        await update.message.reply_text(_MSG_BAD_SPEED)
+        _rearm(context.user_data, prompt)
         return
+    # Held until the bonus step so the two-step flow writes the filters once.
+    _set_waiting(context.user_data, "bonus_time_min", avg_speed=speed)
+    await _reply_static(update.message, _MSG_BONUS_PROMPT)
 
-    # Token input (Mobile Sessions)
-    if user_waiting_input.get(state_key) == "set_token":
-        bot_token = context.bot.token if context and context.bot else None
-        add_user(bot_id, user_id)
-        result_msg = _save_mobile_input_for_user(bot_id, user_id, text, bot_token=bot_token)
-        await update.message.reply_text(result_msg)
 
-        info_text, menu = build_mobile_sessions_menu(bot_id, user_id)
-        await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
-        user_waiting_input.pop(state_key, None)
+async def _in_bonus(update, context, bot_id, user_id, prompt, text):
+    """Ends datetime step 2 (bonus)."""
+    bonus = _parse_float(text)
+    if bonus is None or bonus < 0:
+        await update.message.reply_text(_MSG_BAD_BONUS)
+        _rearm(context.user_data, prompt)
         return
+    filters_data = await db_run(get_filters, bot_id, user_id)
+    updates = {"bonus_time_min": bonus}
+    speed = prompt.get("avg_speed")
+    if speed is not None:
+        updates["avg_speed_kmh"] = speed
+    if any(filters_data.get(k) != v for k, v in updates.items()):
+        await db_run(put_filter_values, bot_id, user_id, filters_data, updates)
+    info_text, menu = build_ends_dt_menu(bot_id, user_id, filters_data=filters_data)
+    _reply_bg(
+        context, update, f"✅ Ends datetime parameters saved.\n\n{info_text}", parse_mode="Markdown", reply_markup=menu
+    )
 
-    # Booked slot creation
-    if state_key in adding_slot_step:
-        step_info = adding_slot_step[state_key]
-        if step_info["step"] == 1:
-            dt = validate_datetime(text)
-            if not dt:
-                await update.message.reply_text("❌ Format incorrect. Utilise `dd/mm/yyyy hh:mm`.")
-                return
-            step_info["from"] = text
-            step_info["step"] = 2
-            await update.message.reply_text(
-                "📅 Send *end date/time* in format `dd/mm/yyyy hh:mm`:",
-                parse_mode="Markdown",
-            )
-            return
-        if step_info["step"] == 2:
-            dt = validate_datetime(text)
-            if not dt:
-                await update.message.reply_text("❌ Format incorrect. Utilise `dd/mm/yyyy hh:mm`.")
-                return
-            step_info["to"] = text
-            step_info["step"] = 3
-            await update.message.reply_text(
-                "✏️ Optionally send a *name* for this slot, or type `-` to skip:",
-                parse_mode="Markdown",
-            )
-            return
-        if step_info["step"] == 3:
-            name = None if text == "-" else text
-            add_booked_slot(bot_id, user_id, step_info["from"], step_info["to"], name)
-            await update.message.reply_text("✅ Booked slot saved!")
-            del adding_slot_step[state_key]
-            info_text, menu = build_booked_slots_menu(bot_id, user_id)
-            await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
-            return
 
-    # Work schedule 2-step flow
-    if user_waiting_input.get(state_key) == "work_schedule_start":
-        try:
-            datetime.strptime(text, "%H:%M")
-        except Exception:
-            info_text, menu = build_work_schedule_start_prompt()
-            await update.message.reply_text("❌ Invalid time. Please use `HH:MM` (e.g., `08:00`).", parse_mode="Markdown")
-            await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
-            return
-        work_schedule_state[state_key] = {"start": text}
-        user_waiting_input[state_key] = "work_schedule_end"
-        info_text, menu = build_work_schedule_end_prompt()
-        await update.message.reply_text("✅ Start time saved.", parse_mode="Markdown")
-        await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
+async def _save_filter_value(update, context, bot_id, user_id, field, value, shown):
+    filters_data = await db_run(get_filters, bot_id, user_id)
+    # Re-submitting the stored value is a no-op: skip the serialise + write.
+    if filters_data.get(field) == value:
+        confirm = f"ℹ️ {_field_label_md(field)} is already {shown}"
+    else:
+        await db_run(put_filter_values, bot_id, user_id, filters_data, {field: value})
+        confirm = f"✅ Updated {_field_label_md(field)} to {shown}"
+    info_text, menu = build_filters_menu(filters_data, user_id, bot_id, as_user_id=user_id)
+    _reply_bg(context, update, f"{confirm}\n\n{info_text}", parse_mode="Markdown", reply_markup=menu)
+
+
+async def _in_work_time(update, context, bot_id, user_id, prompt, text):
+    """Work start/end (legacy direct, not used in UI now)."""
+    if not validate_hhmm(text):
+        await update.message.reply_text(_MSG_BAD_HHMM)
         return
+    await _save_filter_value(update, context, bot_id, user_id, prompt["field"], text, text)
 
-    if user_waiting_input.get(state_key) == "work_schedule_end":
-        try:
-            datetime.strptime(text, "%H:%M")
-        except Exception:
-            info_text, menu = build_work_schedule_end_prompt()
-            await update.message.reply_text("❌ Invalid time. Please use `HH:MM` (e.g., `20:00`).", parse_mode="Markdown")
-            await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
-            return
-        start = (work_schedule_state.get(state_key) or {}).get("start")
-        if not start:
-            user_waiting_input[state_key] = "work_schedule_start"
-            info_text, menu = build_work_schedule_start_prompt()
-            await update.message.reply_text("⚠️ Let's try again. Please enter work START.", parse_mode="Markdown")
-            await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
-            return
-        filters_data = get_filters(bot_id, user_id)
-        filters_data["work_start"] = start
-        filters_data["work_end"] = text
-        update_filters(bot_id, user_id, json.dumps(filters_data))
-        user_waiting_input.pop(state_key, None)
-        work_schedule_state.pop(state_key, None)
-        await update.message.reply_text(f"✅ Work schedule updated to `{start} – {text}`.", parse_mode="Markdown")
-        info_text, menu = build_filters_menu(filters_data, user_id, bot_id, as_user_id=user_id)
-        await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
+
+async def _in_positive_float(update, context, bot_id, user_id, prompt, text):
+    val = _parse_float(text)
+    if val is None or val <= 0:
+        await update.message.reply_text(_MSG_BAD_POSFLOAT)
         return
+    # Floats render without Markdown metacharacters.
+    await _save_filter_value(update, context, bot_id, user_id, prompt["field"], val, val)
+
+
+async def _in_filter_value(update, context, bot_id, user_id, prompt, text):
+    await _save_filter_value(update, context, bot_id, user_id, prompt["field"], text, escape_markdown(text))
+
+
+_FIELD_HANDLERS = {
+    "add_blocked_day": _in_blocked_day,
+    **{field: _in_blacklist for field in _BLACKLIST_INPUT_KEYS},
+    "avg_speed_kmh": _in_avg_speed,
+    "bonus_time_min": _in_bonus,
+    "work_start": _in_work_time,
+    "work_end": _in_work_time,
+    **{
+        field: _in_positive_float
+        for field in ("price_min", "price_max", "gap", "min_duration", "min_km", "max_km")
+    },
+}
+
+
+# ---- Multi-message flows ----
+# Same arguments as the callback handlers plus the text. These leave
+# user_data["prompt"] in place until the input is accepted, unlike the
+# single-shot field handlers, which handle_text hands the prompt it took.
+async def _st_timezone(update, context, bot_id, user_id, admin_mode, text):
+    user_data = context.user_data
+    tz = text
+    if not is_known_tz(tz):
+        await update.message.reply_text(_MSG_BAD_TZ)
+        return
+    if await db_run(set_user_timezone, bot_id, user_id, tz):
+        user_data.pop("stats_cache", None)
+        confirm = f"✅ Timezone set to `{tz}`."
+    else:
+        confirm = f"ℹ️ Timezone is already `{tz}`."
+    user_data.pop("prompt", None)
+    info_text, menu = await db_run(build_settings_menu, user_id, bot_id, allow_tz_change=admin_mode, as_user_id=user_id)
+    _reply_bg(context, update, f"{confirm}\n\n{info_text}", parse_mode="Markdown", reply_markup=menu)
+
+
+async def _st_token(update, context, bot_id, user_id, admin_mode, text):
+    user_data = context.user_data
+    await db_run(add_user, bot_id, user_id)
+    result_msg = await _save_mobile_input_for_user(bot_id, user_id, text, context=context)
+    user_data.pop("stats_cache", None)
+    user_data.pop("prompt", None)
+    info_text, menu = await db_run(build_mobile_sessions_menu, bot_id, user_id)
+    _reply_bg(
+        context, update, f"{escape_markdown(result_msg)}\n\n{info_text}", parse_mode="Markdown", reply_markup=menu
+    )
 
-    # Field updates & special inputs
-    if state_key in user_waiting_input:
-        field = user_waiting_input.pop(state_key)
 
-        # Add a blocked day
-        if field == "add_blocked_day":
-            if not validate_day(text):
-                await update.message.reply_text("❌ Wrong format. Please send a date like `31/12/2025`.")
-                return
-            existing = [d["day"] for d in get_blocked_days(bot_id, user_id)]
-            if text in existing:
-                await update.message.reply_text(f"ℹ️ `{text}` is already blocked.")
-            else:
-                add_blocked_day(bot_id, user_id, text)
-                await update.message.reply_text(f"✅ Day `{text}` added to blocked days.")
-            info_text, menu = build_schedule_menu(bot_id, user_id)
-            await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
-            return
+async def _st_work_start(update, context, bot_id, user_id, admin_mode, text):
+    if not validate_hhmm(text):
+        await _reprompt(update.message, _WS_BAD_START_REPLY)
+        return
+    _set_waiting(context.user_data, "work_schedule_end", ws_start=text)
+    await _reprompt(update.message, _WS_START_SAVED_REPLY)
 
-        # Add to blacklists (single value or comma-separated list)
-        if field in ("pickup_blacklist_add", "dropoff_blacklist_add", "flight_blacklist_add"):
-            items = [p.strip() for p in text.split(",") if p.strip()]
-            if not items:
-                await update.message.reply_text(
-                    "❌ Please send at least one value (e.g., `USA` or `USA, NYC`).",
-                    parse_mode="Markdown",
-                )
-                user_waiting_input[state_key] = field
-                return
 
-            filters_data = get_filters(bot_id, user_id)
-            if field == "pickup_blacklist_add":
-                key = "pickup_blacklist"
-            elif field == "dropoff_blacklist_add":
-                key = "dropoff_blacklist"
-            else:
-                key = "flight_blacklist"
-            current = filters_data.get(key, []) or []
+async def _st_work_end(update, context, bot_id, user_id, admin_mode, text):
+    user_data = context.user_data
+    if not validate_hhmm(text):
+        await _reprompt(update.message, _WS_BAD_END_REPLY)
+        return
+    start = user_data["prompt"].get("ws_start")
+    if not start:
+        _set_waiting(user_data, "work_schedule_start")
+        await _reprompt(update.message, _WS_RETRY_START_REPLY)
+        return
+    filters_data = await db_run(get_filters, bot_id, user_id)
+    if filters_data.get("work_start") == start and filters_data.get("work_end") == text:
+        confirm = f"ℹ️ Work schedule is already `{start} – {text}`."
+    else:
+        await db_run(put_filter_values, bot_id, user_id, filters_data, {"work_start": start, "work_end": text})
+        confirm = f"✅ Work schedule updated to `{start} – {text}`."
+    user_data.pop("prompt", None)
+    info_text, menu = build_filters_menu(filters_data, user_id, bot_id, as_user_id=user_id)
+    _reply_bg(context, update, f"{confirm}\n\n{info_text}", parse_mode="Markdown", reply_markup=menu)
 
-            def _norm_flight(s: str) -> str:
-                return re.sub(r"[^A-Za-z0-9]", "", s or "").upper()
 
-            if key == "flight_blacklist":
-                current_norm = {_norm_flight(x): x for x in current if _norm_flight(x)}
-            else:
-                current_lower = {x.lower() for x in current}
-            added, skipped = [], []
-            for item in items:
-                if key == "flight_blacklist":
-                    norm = _norm_flight(item)
-                    if not norm:
-                        continue
-                    disp = re.sub(r"\s+", " ", item.strip()).upper()
-                    if norm in current_norm:
-                        skipped.append(disp)
-                    else:
-                        current.append(disp)
-                        current_norm[norm] = disp
-                        added.append(disp)
-                else:
-                    if item.lower() in current_lower:
-                        skipped.append(item)
-                    else:
-                        current.append(item)
-                        current_lower.add(item.lower())
-                        added.append(item)
-
-            filters_data[key] = current
-            update_filters(bot_id, user_id, json.dumps(filters_data))
-
-            msg_lines = []
-            if added:
-                msg_lines.append("✅ Added: " + ", ".join(f"`{a}`" for a in added))
-            if skipped:
-                msg_lines.append("ℹ️ Already present: " + ", ".join(f"`{s}`" for s in skipped))
-            await update.message.reply_text(
-                "\n".join(msg_lines) if msg_lines else "Nothing to add.",
-                parse_mode="Markdown",
-            )
-
-            if key == "pickup_blacklist":
-                info_text, menu = build_pickup_blacklist_menu(bot_id, user_id)
-            elif key == "dropoff_blacklist":
-                info_text, menu = build_dropoff_blacklist_menu(bot_id, user_id)
-            else:
-                info_text, menu = build_flight_blacklist_menu(bot_id, user_id)
-            await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
-            return
+# ---- Booked slot creation (one handler per prompt["step"]) ----
+async def _slot_from(update, context, prompt, bot_id, user_id, text):
+    if not validate_datetime(text):
+        await update.message.reply_text(_MSG_BAD_DATETIME)
+        return
+    prompt["from"] = text
+    prompt["step"] = 2
+    await _reply_static(update.message, _MSG_SLOT_END_PROMPT)
 
-        # Ends datetime step 1 (speed)
-        if field == "avg_speed_kmh":
-            try:
-                speed = float(text)
-                if speed <= 0:
-                    raise ValueError()
-            except Exception:
-                await update.message.reply_text("❌ Please send a float greater than 0 for *average speed (km/h)*.")
-                user_waiting_input[state_key] = "avg_speed_kmh"
-                return
-            filters_data = get_filters(bot_id, user_id)
-            filters_data["avg_speed_kmh"] = speed
-            update_filters(bot_id, user_id, json.dumps(filters_data))
-            user_waiting_input[state_key] = "bonus_time_min"
-            await update.message.reply_text(
-                "⏱️ *Enter bonus time in minutes* (example: `60`)\n\n"
-                "_This is added to the estimated duration._",
-                parse_mode="Markdown",
-            )
-            return
 
-        # Ends datetime step 2 (bonus)
-        if field == "bonus_time_min":
-            try:
-                bonus = float(text)
-                if bonus < 0:
-                    raise ValueError()
-            except Exception:
-                await update.message.reply_text("❌ Please send a non-negative float for *bonus time (minutes)*.")
-                user_waiting_input[state_key] = "bonus_time_min"
-                return
-            filters_data = get_filters(bot_id, user_id)
-            filters_data["bonus_time_min"] = bonus
-            update_filters(bot_id, user_id, json.dumps(filters_data))
-            await update.message.reply_text("✅ Ends datetime parameters saved.")
-            info_text, menu = build_ends_dt_menu(bot_id, user_id)
-            await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
-            return
+async def _slot_to(update, context, prompt, bot_id, user_id, text):
+    if not validate_datetime(text):
+        await update.message.reply_text(_MSG_BAD_DATETIME)
+        return
+    prompt["to"] = text
+    prompt["step"] = 3
+    await _reply_static(update.message, _MSG_SLOT_NAME_PROMPT)
 
-        # Work start/end (legacy direct, not used in UI now)
-        if field in ("work_start", "work_end"):
-            try:
-                datetime.strptime(text, "%H:%M")
-            except Exception:
-                await update.message.reply_text("❌ Please send time as `HH:MM` (e.g., `08:00`).")
-                return
-            filters_data = get_filters(bot_id, user_id)
-            filters_data[field] = text
-            update_filters(bot_id, user_id, json.dumps(filters_data))
-            await update.message.reply_text(f"✅ Updated {field} to {text}")
-            info_text, menu = build_filters_menu(filters_data, user_id, bot_id, as_user_id=user_id)
-            await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
-            return
 
-        # Numeric fields
-        value = text
-        if field in ["price_min", "price_max", "gap", "min_duration", "min_km", "max_km"]:
-            try:
-                val = float(value)
-                if val <= 0:
-                    raise ValueError()
-            except Exception:
-                await update.message.reply_text("❌ Please send a float greater than 0 (e.g., `50`).")
-                return
-            value = val
-
-        filters_data = get_filters(bot_id, user_id)
-        filters_data[field] = value
-        update_filters(bot_id, user_id, json.dumps(filters_data))
-        await update.message.reply_text(f"✅ Updated {field} to {value}")
-        info_text, menu = build_filters_menu(filters_data, user_id, bot_id, as_user_id=user_id)
-        await update.message.reply_text(info_text, parse_mode="Markdown", reply_markup=menu)
+async def _slot_name(update, context, prompt, bot_id, user_id, text):
+    name = None if text == "-" else text
+    await db_run(add_booked_slot, bot_id, user_id, prompt["from"], prompt["to"], name)
+    context.user_data.pop("prompt", None)
+    info_text, menu = await db_run(build_booked_slots_menu, bot_id, user_id)
+    _reply_bg(context, update, f"✅ Booked slot saved!\n\n{info_text}", parse_mode="Markdown", reply_markup=menu)
+
+
+_SLOT_STEPS = {1: _slot_from, 2: _slot_to, 3: _slot_name}
+
+
+async def _st_booked_slot(update, context, bot_id, user_id, admin_mode, text):
+    prompt = context.user_data["prompt"]
+    step = _SLOT_STEPS.get(prompt.get("step", 1), _slot_from)
+    await step(update, context, prompt, bot_id, user_id, text)
+
+
+_STATE_HANDLERS = {
+    "set_timezone": _st_timezone,
+    "set_token": _st_token,
+    "work_schedule_start": _st_work_start,
+    "work_schedule_end": _st_work_end,
+    "booked_slot": _st_booked_slot,
+}
+
+
+async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    app_bot_id, bot_id, user_id, admin_mode = _resolve_target(update, context)
+    await _capture(context, update, app_bot_id)
+    if bot_id is None or user_id is None:
+        await update.message.reply_text(_MSG_SELECT_BOT)
+        return
+    user_data = context.user_data
+    _expire_waiting(user_data)
+    text = update.message.text.strip()
+
+    field = _waiting_field(user_data)
+    if field is None:
+        return
+    handler = _STATE_HANDLERS.get(field)
+    if handler:
+        await handler(update, context, bot_id, user_id, admin_mode, text)
+        return
+
+    # Field updates & special inputs: the prompt is answered either way.
+    prompt = user_data.pop("prompt")
+    handler = _FIELD_HANDLERS.get(field, _in_filter_value)
+    await handler(update, context, bot_id, user_id, prompt, text)
@@ -1,70 +1,92 @@
+import asyncio
 import time
+from collections import OrderedDict
 from typing import Optional
 
-from .storage import _get_mobile_token
+from .storage import _get_mobile_token, db_run, get_bl_uuid
 from .portal import _athena_login, _portal_get_me, _p1_get_me_profile, _portal_token_expired
-from db import get_bl_uuid, get_bl_account_full, get_portal_token, update_portal_token, set_bl_uuid
+from db import get_bl_account_full, get_portal_token, update_portal_token, set_bl_uuid
 
 _UUID_ATTEMPT_COOLDOWN_S = 3600  # avoid hammering: try at most once/hour per user
-_last_uuid_attempt: dict[tuple[str, int], float] = {}
+_UUID_ATTEMPT_MAX = 100_000
+# (bot_id, user_id) -> monotonic time of the last claimed attempt, oldest first.
+# Past the cap the oldest claims go; those are the ones whose cooldown lapsed
+# first, so only the least recently tried users become due early.
+_last_uuid_attempt: "OrderedDict[tuple[str, int], float]" = OrderedDict()
 
+# After a restart every user's first update is due at once; cap the portal
+# lookups in flight instead of opening one per user.
+_UUID_LOOKUPS = asyncio.Semaphore(8)
 
-def _try_update_bl_uuid(bot_id: Optional[str], user_id: int):
+
+def _uuid_attempt_due(bot_id: Optional[str], user_id: int) -> bool:
+    """Claim this hour's lookup for the user; False while the cooldown runs."""
     if not bot_id:
-        return
-    # debounce
-    now = time.time()
+        return False
+    now = time.monotonic()
     key = (bot_id, int(user_id))
-    last = _last_uuid_attempt.get(key, 0)
-    if now - last < _UUID_ATTEMPT_COOLDOWN_S:
-        return
+    last = _last_uuid_attempt.get(key)
+    if last is not None and now - last < _UUID_ATTEMPT_COOLDOWN_S:
+        return False
     _last_uuid_attempt[key] = now
+    _last_uuid_attempt.move_to_end(key)
+    while len(_last_uuid_attempt) > _UUID_ATTEMPT_MAX:
+        _last_uuid_attempt.popitem(last=False)
+    return True
+
+
+async def _try_update_bl_uuid(bot_id: str, user_id: int):
+    # Callers claim the attempt with _uuid_attempt_due() first.
+    async with _UUID_LOOKUPS:
+        await _lookup_bl_uuid(bot_id, user_id)
+
 
+async def _lookup_bl_uuid(bot_id: str, user_id: int):
     # already saved?
     try:
-        if get_bl_uuid(bot_id, user_id):
+        if await db_run(get_bl_uuid, bot_id, user_id):
             return
     except Exception:
         pass
 
     # 1) Prefer Partner Portal (/me) if we have BL email+password
     try:
-        creds = get_bl_account_full(bot_id, user_id)  # returns (email, password) or (None, None)
+        creds = await db_run(get_bl_account_full, bot_id, user_id)  # returns (email, password) or (None, None)
     except Exception:
         creds = (None, None)
 
     email, password = (creds or (None, None))
     if email and password:
         # ensure portal token
-        ptoken = get_portal_token(bot_id, user_id)
+        ptoken = await db_run(get_portal_token, bot_id, user_id)
         if _portal_token_expired(ptoken):
-            ok, new_tok, note = _athena_login(email, password)
+            ok, new_tok, note = await _athena_login(email, password)
             if ok and new_tok:
-                update_portal_token(bot_id, user_id, new_tok)
+                await db_run(update_portal_token, bot_id, user_id, new_tok)
                 ptoken = new_tok
             else:
                 ptoken = None  # fallback to P1 below
         if ptoken:
-            status, payload = _portal_get_me(ptoken)
+            status, payload = await _portal_get_me(ptoken)
             if status == 401 or status == 403:
                 # try one re-login
-                ok, new_tok, note = _athena_login(email, password)
+                ok, new_tok, note = await _athena_login(email, password)
                 if ok and new_tok:
-                    update_portal_token(bot_id, user_id, new_tok)
-                    status, payload = _portal_get_me(new_tok)
+                    await db_run(update_portal_token, bot_id, user_id, new_tok)
+                    status, payload = await _portal_get_me(new_tok)
             if status and 200 <= status < 300 and isinstance(payload, dict):
                 bl_id = payload.get("id")
                 if isinstance(bl_id, str) and bl_id.strip():
-                    set_bl_uuid(bot_id, user_id, bl_id.strip())
+                    await db_run(set_bl_uuid, bot_id, user_id, bl_id.strip())
                     return  # done
 
     # 2) Fallback to Mobile API (/api/v1/me/profile)
-    token = _get_mobile_token(bot_id, user_id)
+    token = await db_run(_get_mobile_token, bot_id, user_id)
     if token:
-        status, payload = _p1_get_me_profile(token)
+        status, payload = await _p1_get_me_profile(token)
         if status and 200 <= status < 300 and isinstance(payload, dict):
             # Prefer 'uuid' if present; else try common alternates
             bl_id = payload.get("uuid") or payload.get("id") or payload.get("chauffeur_id")
             if isinstance(bl_id, str) and bl_id.strip():
-                set_bl_uuid(bot_id, user_id, bl_id.strip())
+                await db_run(set_bl_uuid, bot_id, user_id, bl_id.strip())
                 return
@@ -1,40 +1,34 @@
-import sqlite3
+from functools import lru_cache
 from typing import Optional
 from datetime import datetime, timedelta, timezone
-from dateutil.tz import gettz
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 
 from .config import BOOKED_SLOTS_URL, SCHEDULE_URL, CURRENT_SCHEDULE_URL, BL_ACCOUNT_URL, MINI_APP_BASE, _with_bot_id
-from .storage import get_filters
+from .storage import get_filters, get_user_bundle, get_blocked_days
 from .utils import (
     mask_email,
+    fmt_dt_local,
     fmt_money,
     fmt_km,
     fmt_minutes,
-    fmt_dt_local,
-    status_emoji,
-    safe,
+    _gettz_cached,
     _esc,
     _norm_guest_requests,
 )
 from db import (
-    DB_FILE,
     get_user_timezone,
-    get_token_status,
     get_notifications,
     get_booked_slots,
-    get_blocked_days,
     get_vehicle_classes_state,
     get_endtime_formulas,
     get_offer_logs_counts,
     get_offer_logs,
     get_offer_stats,
-    get_token_auto_refresh,
 )
 
 
-def build_main_menu(is_active: bool):
-    status_text = "✅ Active" if is_active else "❌ Not active"
+# ── Static keyboards (built once at import) ──────────────────
+def _main_menu_markup(is_active: bool) -> InlineKeyboardMarkup:
     action_buttons = [InlineKeyboardButton("🔴 Deactivate", callback_data="deactivate")] if is_active else [
         InlineKeyboardButton("🟢 Activate", callback_data="activate")
     ]
@@ -49,17 +43,80 @@ def build_main_menu(is_active: bool):
         ],
         action_buttons,
     ]
-    return InlineKeyboardMarkup(keyboard), status_text
+    return InlineKeyboardMarkup(keyboard)
+
+
+_MAIN_MENU_ACTIVE = _main_menu_markup(True)
+_MAIN_MENU_INACTIVE = _main_menu_markup(False)
+_BACK_TO_FILTERS_KB = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")]])
+_WORK_SCHEDULE_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✏️ Update schedule", callback_data="update_work_schedule")],
+    [InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")],
+])
+_ENDS_DT_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✏️ Update params", callback_data="update_ends_dt")],
+    [InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")],
+])
+_MOBILE_SESSIONS_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ Add/Update token", callback_data="add_mobile_session")],
+    [InlineKeyboardButton("⬅️ Back to Settings", callback_data="settings")],
+])
+_BOOKED_SLOTS_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ Add booked slot", callback_data="add_booked_slot")],
+    [InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")],
+])
+_PICKUP_BLACKLIST_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ Add pickup term", callback_data="add_pickup_blacklist")],
+    [InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")],
+])
+_DROPOFF_BLACKLIST_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ Add dropoff term", callback_data="add_dropoff_blacklist")],
+    [InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")],
+])
+_FLIGHT_BLACKLIST_TAIL = (
+    (InlineKeyboardButton("➕ Add flight number", callback_data="add_flight_blacklist"),),
+    (InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters"),),
+)
+_BACK_TO_FILTERS_ROW = (InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters"),)
+_SCHEDULE_TAIL = (
+    (InlineKeyboardButton("➕ Add a day", callback_data="add_blocked_day"),),
+    _BACK_TO_FILTERS_ROW,
+)
+_VEHICLE_CLASSES = ("SUV", "VAN", "Business", "First", "Electric", "Sprinter")
+
+
+def _class_row(v: str, transfer_on: bool, hourly_on: bool) -> tuple:
+    return (
+        InlineKeyboardButton(f"{'🟢' if transfer_on else '🔴'} {v}", callback_data=f"toggle_transfer_{v}"),
+        InlineKeyboardButton(f"{'🟢' if hourly_on else '🔴'} {v}", callback_data=f"toggle_hourly_{v}"),
+    )
+
+
+# All four rows per class, indexed by (transfer << 1) | hourly.
+_CLASS_ROWS = {
+    v: tuple(_class_row(v, bool(state & 2), bool(state & 1)) for state in range(4))
+    for v in _VEHICLE_CLASSES
+}
+_CLASSES_HEADER_ROW = (
+    InlineKeyboardButton("TRANSFER", callback_data="noop"),
+    InlineKeyboardButton("HOURLY", callback_data="noop"),
+)
+
+
+def build_main_menu(is_active: bool):
+    status_text = "✅ Active" if is_active else "❌ Not active"
+    return (_MAIN_MENU_ACTIVE if is_active else _MAIN_MENU_INACTIVE), status_text
 
 
 def build_settings_menu(user_id: int, bot_id: Optional[str] = None, allow_tz_change: bool = False, as_user_id: Optional[int] = None):
-    tz = get_user_timezone(bot_id, user_id) if bot_id else "—"
-    token_status = get_token_status(bot_id, user_id) if bot_id else "unknown"
+    bundle = get_user_bundle(bot_id, user_id) if bot_id else {}
+    tz = bundle.get("timezone", "—")
+    token_status = bundle.get("token_status", "unknown")
     dot = "🟢" if token_status == "valid" else ("🔴" if token_status == "expired" else "⚪")
-    auto_refresh = get_token_auto_refresh(bot_id, user_id) if bot_id else False
+    auto_refresh = bundle.get("token_auto_refresh", False)
 
     # Notifications status summary
-    prefs = get_notifications(bot_id, user_id) if bot_id else {}
+    prefs = bundle.get("notifications") or {}
     def onoff(flag): return "🟢" if flag else "🔴"
     notif_line = (
         f"{onoff(prefs.get('accepted', True))} Accepted  |  "
@@ -68,23 +125,7 @@ def build_settings_menu(user_id: int, bot_id: Optional[str] = None, allow_tz_cha
     )
 
     # BL account masked email (wrap in backticks to avoid Markdown parsing of *)
-    try:
-        from db import get_bl_account
-    except Exception:
-        def get_bl_account(_bot_id, _uid):
-            return None
-
-    try:
-        acc = get_bl_account(bot_id, user_id) if bot_id else None
-        if isinstance(acc, dict):
-            bl_email = acc.get("email")
-        elif isinstance(acc, (list, tuple)):
-            bl_email = acc[0] if acc else None
-        else:
-            bl_email = acc if isinstance(acc, str) else None
-    except Exception:
-        bl_email = None
-
+    bl_email = bundle.get("bl_email")
     bl_email_disp = mask_email(bl_email) if bl_email else "—"
     bl_email_line = f"`{bl_email_disp}`" if bl_email_disp != "—" else "—"
 
@@ -103,6 +144,13 @@ def build_settings_menu(user_id: int, bot_id: Optional[str] = None, allow_tz_cha
         "• *BL account* to set your Blacklane email/password"
     )
 
+    return info_text, _settings_keyboard(bot_id, as_user_id, ar_label, allow_tz_change)
+
+
+@lru_cache(maxsize=128)
+def _settings_keyboard(
+    bot_id: Optional[str], as_user_id: Optional[int], ar_label: str, allow_tz_change: bool
+) -> InlineKeyboardMarkup:
     keyboard = [
         [InlineKeyboardButton("🔔 Notifications", callback_data="notifications")],
         [InlineKeyboardButton("🪪 BL account", web_app=WebAppInfo(url=_with_bot_id(BL_ACCOUNT_URL, bot_id, as_user_id)))],
@@ -112,20 +160,15 @@ def build_settings_menu(user_id: int, bot_id: Optional[str] = None, allow_tz_cha
     ]
     if allow_tz_change:
         keyboard.insert(0, [InlineKeyboardButton("🌍 Change timezone", callback_data="change_tz")])
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return InlineKeyboardMarkup(keyboard)
 
 
 def build_mobile_sessions_menu(bot_id: str, user_id: int):
-    token_status = get_token_status(bot_id, user_id)
+    bundle = get_user_bundle(bot_id, user_id)
+    token_status = bundle["token_status"]
     dot = "🟢" if token_status == "valid" else ("🔴" if token_status == "expired" else "⚪")
 
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT token FROM users WHERE bot_id = ? AND telegram_id = ?", (bot_id, user_id))
-    row = c.fetchone()
-    conn.close()
-
-    token = row[0] if row else None
+    token = bundle["token"]
     # show only head/tail (6 chars) to avoid leaking the JWT in chat logs
     from .utils import mask_secret
     token_disp = mask_secret(token, keep=6) if token else "—"
@@ -136,53 +179,12 @@ def build_mobile_sessions_menu(bot_id: str, user_id: int):
         f"Token:\n`{token_disp}`\n\n"
         "Use *Add/Update token* to paste a full HTTP dump (Authorization + headers)."
     )
-    keyboard = [
-        [InlineKeyboardButton("➕ Add/Update token", callback_data="add_mobile_session")],
-        [InlineKeyboardButton("⬅️ Back to Settings", callback_data="settings")],
-    ]
-    return info_text, InlineKeyboardMarkup(keyboard)
-
+    return info_text, _MOBILE_SESSIONS_KB
 
-def build_filters_menu(filters_data: dict, user_id: int, bot_id: Optional[str] = None, as_user_id: Optional[int] = None):
-    min_price   = filters_data.get("price_min", 0)
-    max_price   = filters_data.get("price_max", 0)
-    work_start  = filters_data.get("work_start", "00:00")
-    work_end    = filters_data.get("work_end", "00:00")
-    delay       = filters_data.get("gap", 120)
-    min_duration = filters_data.get("min_duration", 0)
-    min_km      = filters_data.get("min_km", 0)
-    max_km      = filters_data.get("max_km", 0)
-
-    # End-time formulas (admin-assigned)
-    rows = get_endtime_formulas(bot_id, user_id) if bot_id else []
-    if rows:
-        def fmt_row(it):
-            win = f"{it['start']}–{it['end']}" if it.get("start") and it.get("end") else "else"
-            try:
-                spd = int(float(it["speed_kmh"]))
-            except Exception:
-                spd = it["speed_kmh"]
-            try:
-                bon = int(float(it.get("bonus_min", 0)))
-            except Exception:
-                bon = it.get("bonus_min", 0)
-            return f"• {win}: {spd} km/h + {bon} min"
-        formulas_text = "\n" + "\n".join(fmt_row(it) for it in rows)
-    else:
-        formulas_text = "\n— (not assigned)"
-
-    info_text = (
-        f"⚙️ *Bot filters*\n\n"
-        f"💸 Min price: {min_price}\n"
-        f"💸 Max price: {max_price}\n"
-        f"🕒 Work schedule: {work_start} – {work_end}\n"
-        f"⏳ Delay (gap): {delay} min\n"
-        f"⌛ Min duration: {min_duration} h\n"
-        f"📏 Min km: {min_km}\n"
-        f"📏 Max km: {max_km}\n"
-       
-    )
 
+@lru_cache(maxsize=64)
+def _filters_keyboard(bot_id: Optional[str], as_user_id: Optional[int]) -> InlineKeyboardMarkup:
+    # Only the WebApp URLs depend on (bot_id, as_user_id); the layout is fixed.
     keyboard = [
         [InlineKeyboardButton("📦 Booked slots", web_app=WebAppInfo(url=_with_bot_id(BOOKED_SLOTS_URL, bot_id, as_user_id)))],
         [InlineKeyboardButton("📅 Schedule (blocked days)", web_app=WebAppInfo(url=_with_bot_id(SCHEDULE_URL, bot_id, as_user_id)))],
@@ -212,12 +214,47 @@ def build_filters_menu(filters_data: dict, user_id: int, bot_id: Optional[str] =
         [InlineKeyboardButton("✈️ Block flights", callback_data="flight_blacklist")],
         [InlineKeyboardButton("⬅️ Back", callback_data="back_to_main")],
     ]
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+
+# typed=True: 50 and 50.0 compare equal but display differently.
+@lru_cache(maxsize=256, typed=True)
+def _filters_text(min_price, max_price, work_start, work_end, delay, min_duration, min_km, max_km) -> str:
+    return (
+        f"⚙️ *Bot filters*\n\n"
+        f"💸 Min price: {min_price}\n"
+        f"💸 Max price: {max_price}\n"
+        f"🕒 Work schedule: {work_start} – {work_end}\n"
+        f"⏳ Delay (gap): {delay} min\n"
+        f"⌛ Min duration: {min_duration} h\n"
+        f"📏 Min km: {min_km}\n"
+        f"📏 Max km: {max_km}\n"
+    )
+
+
+def build_filters_menu(filters_data: dict, user_id: int, bot_id: Optional[str] = None, as_user_id: Optional[int] = None):
+    # Text and keyboard are both memoized on their inputs, so re-showing the
+    # menu after an update only formats when a displayed value changed.
+    values = (
+        filters_data.get("price_min", 0),
+        filters_data.get("price_max", 0),
+        filters_data.get("work_start", "00:00"),
+        filters_data.get("work_end", "00:00"),
+        filters_data.get("gap", 120),
+        filters_data.get("min_duration", 0),
+        filters_data.get("min_km", 0),
+        filters_data.get("max_km", 0),
+    )
+    try:
+        info_text = _filters_text(*values)
+    except TypeError:  # unhashable value written by hand; format without caching
+        info_text = _filters_text.__wrapped__(*values)
+    return info_text, _filters_keyboard(bot_id, as_user_id)
 
 
 # --- Work schedule submenu & prompts ---
-def build_work_schedule_menu(bot_id: str, user_id: int):
-    f = get_filters(bot_id, user_id)
+def build_work_schedule_menu(bot_id: str, user_id: int, filters_data: Optional[dict] = None):
+    f = filters_data if filters_data is not None else get_filters(bot_id, user_id)
     ws = f.get("work_start", "00:00")
     we = f.get("work_end", "00:00")
     info_text = (
@@ -225,23 +262,17 @@ def build_work_schedule_menu(bot_id: str, user_id: int):
         f"Current: `{ws}` – `{we}`\n\n"
         "Use *Update schedule* to set start & end (HH:MM)."
     )
-    keyboard = [
-        [InlineKeyboardButton("✏️ Update schedule", callback_data="update_work_schedule")],
-        [InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")],
-    ]
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return info_text, _WORK_SCHEDULE_KB
 
 
 def build_work_schedule_start_prompt():
     info_text = "🕒 *Enter work START* as `HH:MM` (e.g., `08:00`)."
-    keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")]]
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return info_text, _BACK_TO_FILTERS_KB
 
 
 def build_work_schedule_end_prompt():
     info_text = "🕒 *Enter work END* as `HH:MM` (e.g., `20:00`)."
-    keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")]]
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return info_text, _BACK_TO_FILTERS_KB
 
 
 # --- KM prompts ---
@@ -249,25 +280,22 @@ def build_min_km_input_menu():
     info_text = (
         "📏 *Enter MIN kilometers* as a float (e.g., `50`)."
     )
-    keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")]]
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return info_text, _BACK_TO_FILTERS_KB
 
 
 def build_max_km_input_menu():
     info_text = (
         "📏 *Enter MAX kilometers* as a float (e.g., `150`)."
     )
-    keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")]]
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return info_text, _BACK_TO_FILTERS_KB
 
 
 def build_gap_input_menu():
-    keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")]]
     info_text = (
         "✏️ *Send me the new gap (delay) in MINUTES (format: 100)*\n\n"
         "**It will be the new delay before accepting rides.**"
     )
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return info_text, _BACK_TO_FILTERS_KB
 
 
 def build_min_price_input_menu():
@@ -275,8 +303,7 @@ def build_min_price_input_menu():
         "💸 *Specify a float greater than 0*\n\n"
         "**This will be the new minimum price**"
     )
-    keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")]]
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return info_text, _BACK_TO_FILTERS_KB
 
 
 def build_max_price_input_menu():
@@ -284,8 +311,7 @@ def build_max_price_input_menu():
         "💸 *Specify a float greater than 0*\n\n"
         "**This will be the new maximum price**"
     )
-    keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")]]
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return info_text, _BACK_TO_FILTERS_KB
 
 
 def build_min_duration_input_menu():
@@ -293,8 +319,7 @@ def build_min_duration_input_menu():
         "⌛ *Send me the new minimal hourly rides duration in HOURS (format : 2)*\n\n"
         "**It will be the new minimum for hourly**"
     )
-    keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")]]
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return info_text, _BACK_TO_FILTERS_KB
 
 
 def build_booked_slots_menu(bot_id: str, user_id: int):
@@ -302,107 +327,87 @@ def build_booked_slots_menu(bot_id: str, user_id: int):
     if not slots:
         info_text = "📦 *Booked slots*\n\n_Aucun créneau bloqué pour l'instant._"
     else:
-        info_text = "📦 *Vos créneaux bloqués*\n\n"
+        parts = ["📦 *Vos créneaux bloqués*\n\n"]
         for s in slots:
-            info_text += f"🕒 {s['from']} → {s['to']}"
-            if s['name']:
-                info_text += f" ({s['name']})"
-            info_text += "\n"
-    keyboard = [
-        [InlineKeyboardButton("➕ Add booked slot", callback_data="add_booked_slot")],
-        [InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")]
-    ]
-    return info_text, InlineKeyboardMarkup(keyboard)
+            parts.append(f"🕒 {s['from']} → {s['to']} ({s['name']})\n" if s['name'] else f"🕒 {s['from']} → {s['to']}\n")
+        info_text = "".join(parts)
+    return info_text, _BOOKED_SLOTS_KB
 
 
 def build_schedule_menu(bot_id: str, user_id: int):
     days = get_blocked_days(bot_id, user_id)
+    keyboard = []
     if not days:
         info_text = "📅 *Blocked days*\n\n_Aucun jour bloqué pour le moment._"
     else:
-        info_text = "📅 *Blocked days*\n\n" + "\n".join([f"• {d['day']}" for d in days])
-    keyboard = []
-    for d in days:
-        keyboard.append([InlineKeyboardButton(f"🗑️ {d['day']}", callback_data=f"delete_day_{d['id']}")])
-    keyboard.append([InlineKeyboardButton("➕ Add a day", callback_data="add_blocked_day")])
-    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")])
+        # text lines and delete buttons in a single pass over the rows
+        parts = ["📅 *Blocked days*\n"]
+        for d in days:
+            parts.append(f"\n• {d['day']}")
+            keyboard.append([InlineKeyboardButton(f"🗑️ {d['day']}", callback_data=f"delete_day_{d['id']}")])
+        info_text = "".join(parts)
+    keyboard.extend(_SCHEDULE_TAIL)
     return info_text, InlineKeyboardMarkup(keyboard)
 
 
-def build_classes_menu(bot_id: str, user_id: int):
-    state = get_vehicle_classes_state(bot_id, user_id)
-    vehicles = ["SUV", "VAN", "Business", "First", "Electric", "Sprinter"]
+def build_classes_menu(bot_id: str, user_id: int, state: Optional[dict] = None):
+    if state is None:
+        state = get_vehicle_classes_state(bot_id, user_id)
     info_text = "🚗 *Change Classes*\n\nClick below to toggle each class:"
-    keyboard = [
-        [
-            InlineKeyboardButton("TRANSFER", callback_data="noop"),
-            InlineKeyboardButton("HOURLY", callback_data="noop")
-        ]
-    ]
-    for v in vehicles:
-        t_state = state["transfer"].get(v, 0)
-        h_state = state["hourly"].get(v, 0)
-        t_symbol = "🟢" if t_state else "🔴"
-        h_symbol = "🟢" if h_state else "🔴"
-        keyboard.append([
-            InlineKeyboardButton(f"{t_symbol} {v}", callback_data=f"toggle_transfer_{v}"),
-            InlineKeyboardButton(f"{h_symbol} {v}", callback_data=f"toggle_hourly_{v}")
-        ])
-    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")])
+    transfer, hourly = state["transfer"], state["hourly"]
+    keyboard = [_CLASSES_HEADER_ROW]
+    keyboard.extend(
+        _CLASS_ROWS[v][(bool(transfer.get(v, 0)) << 1) | bool(hourly.get(v, 0))]
+        for v in _VEHICLE_CLASSES
+    )
+    keyboard.append(_BACK_TO_FILTERS_ROW)
     return info_text, InlineKeyboardMarkup(keyboard)
 
 
-def build_pickup_blacklist_menu(bot_id: str, user_id: int):
-    filters_data = get_filters(bot_id, user_id)
+def build_pickup_blacklist_menu(bot_id: str, user_id: int, filters_data: Optional[dict] = None):
+    if filters_data is None:
+        filters_data = get_filters(bot_id, user_id)
     items = (filters_data.get("pickup_blacklist") or [])
     if items:
-        lines = "\n".join([f"• {x}" for x in items])
-        info_text = f"🚫 *Pickup blacklist*\n\n{lines}"
+        info_text = "🚫 *Pickup blacklist*\n\n" + "\n".join(f"• {x}" for x in items)
     else:
         info_text = "🚫 *Pickup blacklist*\n\n_Aucune entrée pour le moment._"
-    keyboard = [
-        [InlineKeyboardButton("➕ Add pickup term", callback_data="add_pickup_blacklist")],
-        [InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")],
-    ]
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return info_text, _PICKUP_BLACKLIST_KB
 
 
-def build_dropoff_blacklist_menu(bot_id: str, user_id: int):
-    filters_data = get_filters(bot_id, user_id)
+def build_dropoff_blacklist_menu(bot_id: str, user_id: int, filters_data: Optional[dict] = None):
+    if filters_data is None:
+        filters_data = get_filters(bot_id, user_id)
     items = (filters_data.get("dropoff_blacklist") or [])
     if items:
-        lines = "\n".join([f"• {x}" for x in items])
-        info_text = f"🚫 *Dropoff blacklist*\n\n{lines}"
+        info_text = "🚫 *Dropoff blacklist*\n\n" + "\n".join(f"• {x}" for x in items)
     else:
         info_text = "🚫 *Dropoff blacklist*\n\n_Aucune entrée pour le moment._"
-    keyboard = [
-        [InlineKeyboardButton("➕ Add dropoff term", callback_data="add_dropoff_blacklist")],
-        [InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")],
-    ]
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return info_text, _DROPOFF_BLACKLIST_KB
 
 
-def build_flight_blacklist_menu(bot_id: str, user_id: int):
-    filters_data = get_filters(bot_id, user_id)
+def build_flight_blacklist_menu(bot_id: str, user_id: int, filters_data: Optional[dict] = None):
+    if filters_data is None:
+        filters_data = get_filters(bot_id, user_id)
     items = (filters_data.get("flight_blacklist") or [])
+    keyboard = []
     if items:
-        lines = "\n".join([f"• {x}" for x in items])
-        info_text = f"✈️ *Blocked flights*\n\n{lines}"
+        parts = ["✈️ *Blocked flights*\n"]
+        for idx, flight in enumerate(items):
+            parts.append(f"\n• {flight}")
+            keyboard.append([
+                InlineKeyboardButton(f"🗑️ {flight}", callback_data=f"delete_flight_blacklist:{idx}")
+            ])
+        info_text = "".join(parts)
     else:
         info_text = "✈️ *Blocked flights*\n\n_Aucune entrée pour le moment._"
-    keyboard = []
-    for idx, flight in enumerate(items):
-        keyboard.append([
-            InlineKeyboardButton(f"🗑️ {flight}", callback_data=f"delete_flight_blacklist:{idx}")
-        ])
-    keyboard.append([InlineKeyboardButton("➕ Add flight number", callback_data="add_flight_blacklist")])
-    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")])
+    keyboard.extend(_FLIGHT_BLACKLIST_TAIL)
     return info_text, InlineKeyboardMarkup(keyboard)
 
 
 # --- NEW: Ends datetime menu ---
-def build_ends_dt_menu(bot_id: str, user_id: int):
-    f = get_filters(bot_id, user_id)
+def build_ends_dt_menu(bot_id: str, user_id: int, filters_data: Optional[dict] = None):
+    f = filters_data if filters_data is not None else get_filters(bot_id, user_id)
     speed = f.get("avg_speed_kmh")
     bonus = f.get("bonus_time_min")
     speed_txt = speed if speed is not None else "—"
@@ -413,11 +418,7 @@ def build_ends_dt_menu(bot_id: str, user_id: int):
         f"• Bonus time (minutes): {bonus_txt}\n\n"
         "Use *Update params* to change them."
     )
-    keyboard = [
-        [InlineKeyboardButton("✏️ Update params", callback_data="update_ends_dt")],
-        [InlineKeyboardButton("⬅️ Back", callback_data="back_to_filters")]
-    ]
-    return info_text, InlineKeyboardMarkup(keyboard)
+    return info_text, _ENDS_DT_KB
 
 
 # ---------------- Stats view ----------------
@@ -429,7 +430,7 @@ def _start_of_day(dt: datetime) -> datetime:
 
 
 def _range_to_utc(range_key: str, tz_name: str):
-    tz = gettz(tz_name) or timezone.utc
+    tz = _gettz_cached(tz_name) or timezone.utc
     now = datetime.now(tz)
     label = "All time"
     start = end = None
@@ -549,77 +550,71 @@ def build_stats_summary(bot_id: str, user_id: int, range_key: str = "today"):
     return info_text, InlineKeyboardMarkup(keyboard)
 
 
-def _build_stats_block(r: dict, tz: str) -> str:
+_STATS_STATUS_HDR = {
+    "accepted": "✅ <b>Offer accepted</b>",
+    "not_accepted": "⚠️ <b>Offer not accepted</b>",
+}
+_STATS_REJECTED_HDR = "⛔ <b>Offer rejected</b>"
+_STATS_EMPTY_DROPOFF = (None, "", [])
+
+
+def _build_stats_block(parts: list, r, tz_name: Optional[str]) -> None:
     """
-    Build one HTML block with the same look & fields as offer messages.
+    Append one HTML block (same look & fields as offer messages) to `parts`.
     """
-    status = r.get("status")
-    if status == "accepted":
-        header = "✅ <b>Offer accepted</b>"
-    elif status == "not_accepted":
-        header = "⚠️ <b>Offer not accepted</b>"
-    else:
-        header = "⛔ <b>Offer rejected</b>"
-    reason = r.get("rejection_reason")
+    add = parts.append
+    status = r["status"]
+    add(_STATS_STATUS_HDR.get(status, _STATS_REJECTED_HDR))
+    reason = r["rejection_reason"]
+    if status in ("rejected", "not_accepted") and reason:
+        add(f"\n<i>Reason:</i> {_esc(reason)}")
 
-    typ = safe(r.get("type"), "—").lower()
-    typ_disp = "transfer" if typ == "transfer" else ("hourly" if typ == "hourly" else "—")
-    vclass = safe(r.get("vehicle_class"), "—")
-    price = fmt_money(r.get("price"), r.get("currency"))
+    typ = (r["type"] or "").lower()
+    typ_disp = typ if typ in ("transfer", "hourly") else "—"
+    vclass = r["vehicle_class"] or "—"
+    price_s = fmt_money(r["price"], r["currency"])
+    add(f"\n🚘 <b>Type:</b> {typ_disp}")
+    add(f"\n🚗 <b>Class:</b> {_esc(vclass)}")
+    add(f"\n💰 <b>Price:</b> {_esc(price_s)}")
 
     # Optional columns (present if you extended offer_logs)
-    flight_number = r.get("flight_number")
-    guest_reqs = _norm_guest_requests(r.get("guest_requests"))
-
-    pu = _esc(safe(r.get("pu_address")))
-    do = _esc(r.get("do_address")) if r.get("do_address") not in (None, "", []) else None
-    dist = fmt_km(r.get("estimated_distance_meters"))
-    dur  = fmt_minutes(r.get("duration_minutes"))
-    pu_time = _esc(fmt_dt_local(r.get("pickup_time"), tz))
-    end_time = _esc(fmt_dt_local(r.get("ends_at"), tz))
-
-    lines = [header]
-    if status in ("rejected", "not_accepted") and reason:
-        lines.append(f"<i>Reason:</i> {_esc(reason)}")
-
-    lines += [
-        f"🚘 <b>Type:</b> {_esc(typ_disp)}",
-        f"🚗 <b>Class:</b> {_esc(vclass)}",
-        f"💰 <b>Price:</b> {_esc(price)}",
-    ]
+    flight_number = r["flight_number"]
     if flight_number:
-        lines.append(f"✈️ <b>Flight number:</b> {_esc(flight_number)}")
+        add(f"\n✈️ <b>Flight number:</b> {_esc(flight_number)}")
+    guest_reqs = _norm_guest_requests(r["guest_requests"])
     if guest_reqs:
-        lines.append(f"👁️ <b>Special requests:</b> {_esc(guest_reqs)}")
-
-    if dist != "—":
-        lines.append(f"📏 <b>Distance:</b> {_esc(dist)}")
-    if dur != "—":
-        lines.append(f"⏱️ <b>Duration:</b> {_esc(dur)}")
-
-    lines += [
-        f"🕒 <b>Starts at:</b> {pu_time}",
-        f"⏳ <b>Ends at:</b> {end_time}",
-        "",
-        f"⬆️ <b>Pickup:</b>\n{pu}",
-    ]
-    if do:
-        lines += ["", f"⬇️ <b>Dropoff:</b>\n{do}"]
-
-    return "\n".join(lines)
-
-
-def build_stats_view(bot_id: str, user_id: int, page: int = 0):
+        add(f"\n👁️ <b>Special requests:</b> {_esc(guest_reqs)}")
+
+    meters = r["estimated_distance_meters"]
+    if meters is not None:
+        add(f"\n📏 <b>Distance:</b> {_esc(fmt_km(meters))}")
+    mins = r["duration_minutes"]
+    if mins is not None:
+        add(f"\n⏱️ <b>Duration:</b> {_esc(fmt_minutes(mins))}")
+
+    add(f"\n🕒 <b>Starts at:</b> {_esc(fmt_dt_local(r['pickup_time'], tz_name))}")
+    add(f"\n⏳ <b>Ends at:</b> {_esc(fmt_dt_local(r['ends_at'], tz_name))}")
+    add(f"\n\n⬆️ <b>Pickup:</b>\n{_esc(r['pu_address'] or '—')}")
+    do = r["do_address"]
+    if do not in _STATS_EMPTY_DROPOFF:
+        add(f"\n\n⬇️ <b>Dropoff:</b>\n{_esc(do)}")
+
+
+def build_stats_view(
+    bot_id: str, user_id: int, page: int = 0, counts: Optional[dict] = None, rows: Optional[list] = None
+):
     tz = get_user_timezone(bot_id, user_id)
 
-    counts = get_offer_logs_counts(bot_id, user_id)
+    if counts is None:
+        counts = get_offer_logs_counts(bot_id, user_id)
     total = counts.get("total", 0)
     accepted = counts.get("accepted", 0)
     rejected = counts.get("rejected", 0)
     not_accepted = counts.get("not_accepted", 0)
 
     offset = page * PAGE_SIZE
-    rows = get_offer_logs(bot_id, user_id, limit=PAGE_SIZE, offset=offset)
+    if rows is None:
+        rows = get_offer_logs(bot_id, user_id, limit=PAGE_SIZE, offset=offset)
 
     header = (
         "📊 <b>Your offers</b>\n\n"
@@ -630,12 +625,13 @@ def build_stats_view(bot_id: str, user_id: int, page: int = 0):
         keyboard = [[InlineKeyboardButton("⬅️ Back", callback_data="back_to_main")]]
         return info_text, InlineKeyboardMarkup(keyboard)
 
-    blocks = []
-    for r in rows:
-        blocks.append(_build_stats_block(r, tz))
-
-    body = "\n\n".join(blocks)
-    info_text = header + "\n" + body  # HTML
+    # One flat list for the whole page (HTML), joined once at the end
+    parts = [header, "\n"]
+    for i, r in enumerate(rows):
+        if i:
+            parts.append("\n\n")
+        _build_stats_block(parts, r, tz)
+    info_text = "".join(parts)
 
     has_prev = page > 0
     has_next = (offset + PAGE_SIZE) < total
@@ -652,8 +648,8 @@ def build_stats_view(bot_id: str, user_id: int, page: int = 0):
     return info_text, InlineKeyboardMarkup(keyboard)
 
 
-def build_all_filters_view(bot_id: str, user_id: int):
-    f = get_filters(bot_id, user_id) or {}
+def build_all_filters_view(bot_id: str, user_id: int, filters_data: Optional[dict] = None):
+    f = (filters_data if filters_data is not None else get_filters(bot_id, user_id)) or {}
 
     # === Basics from user filters ===
     pickup_bl   = f.get("pickup_blacklist")  or []
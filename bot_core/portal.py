@@ -1,13 +1,15 @@
 import base64
 import json
 import time
+from functools import lru_cache
 from typing import Optional, Tuple
-import requests
+import httpx
 
 from .config import PORTAL_CLIENT_ID, PORTAL_AUTH_BASE, PARTNER_PORTAL_API, P1_API_BASE
+from .utils import _async_http
 
 
-def _athena_login(email: str, password: str) -> tuple[bool, Optional[str], str]:
+async def _athena_login(email: str, password: str) -> tuple[bool, Optional[str], str]:
     url = f"{PORTAL_AUTH_BASE}/oauth/token"
     payload = {
         "client_id": PORTAL_CLIENT_ID,
@@ -17,7 +19,7 @@ def _athena_login(email: str, password: str) -> tuple[bool, Optional[str], str]:
         "resource_owner_type": "driver",
     }
     try:
-        r = requests.post(url, data=payload, headers={"Accept": "application/json"}, timeout=15)
+        r = await _async_http().post(url, data=payload, headers={"Accept": "application/json"}, timeout=15)
         if 200 <= r.status_code < 300:
             try:
                 j = r.json() or {}
@@ -28,11 +30,11 @@ def _athena_login(email: str, password: str) -> tuple[bool, Optional[str], str]:
         if r.status_code in (401, 403):
             return (False, None, f"unauthorized:{r.status_code}")
         return (False, None, f"upstream:{r.status_code}")
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return (False, None, f"network:{type(e).__name__}")
 
 
-def _portal_get_me(access_token: str) -> tuple[Optional[int], Optional[dict]]:
+async def _portal_get_me(access_token: str) -> tuple[Optional[int], Optional[dict]]:
     url = f"{PARTNER_PORTAL_API}/me"
     headers = {
         "Authorization": f"Bearer {access_token}",
@@ -40,15 +42,15 @@ def _portal_get_me(access_token: str) -> tuple[Optional[int], Optional[dict]]:
         "User-Agent": "BLPortal/uuid-fetch (+bot)",
     }
     try:
-        r = requests.get(url, headers=headers, timeout=15)
+        r = await _async_http().get(url, headers=headers, timeout=15)
         if 200 <= r.status_code < 300:
             return r.status_code, r.json()
         return r.status_code, None
-    except requests.exceptions.RequestException:
+    except (httpx.HTTPError, ValueError):  # ValueError: 2xx with a non-JSON body
         return None, None
 
 
-def _p1_get_me_profile(token: str) -> tuple[Optional[int], Optional[dict]]:
+async def _p1_get_me_profile(token: str) -> tuple[Optional[int], Optional[dict]]:
     url = f"{P1_API_BASE}/api/v1/me/profile"
     headers = {
         "Authorization": token,  # 'Bearer <JWT>'
@@ -57,15 +59,17 @@ def _p1_get_me_profile(token: str) -> tuple[Optional[int], Optional[dict]]:
         "User-Agent": "Chauffeur/uuid-fetch (+bot)",
     }
     try:
-        r = requests.get(url, headers=headers, timeout=15)
+        r = await _async_http().get(url, headers=headers, timeout=15)
         if 200 <= r.status_code < 300:
             return r.status_code, r.json()
         return r.status_code, None
-    except requests.exceptions.RequestException:
+    except (httpx.HTTPError, ValueError):  # ValueError: 2xx with a non-JSON body
         return None, None
 
 
+@lru_cache(maxsize=4096)
 def _jwt_exp_unverified(token: str) -> Optional[int]:
+    # Pure function of the token string; the same few tokens are re-checked on every attempt.
     try:
         parts = (token or "").split(".")
         if len(parts) != 3:
@@ -2,8 +2,24 @@ import asyncio
 from typing import Any
 
 from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, filters
-
-from .config import ADMIN_BOT_TOKEN, ADMIN_BOT_ID, ADMIN_BOT_NAME, BOT_REFRESH_INTERVAL_S
+from telegram.request import HTTPXRequest
+
+try:  # optional: HTTP/2 to api.telegram.org needs the h2 package
+    import h2  # noqa: F401
+    _HTTP_VERSION = "2"
+except ImportError:
+    _HTTP_VERSION = "1.1"
+
+from .config import (
+    ADMIN_BOT_TOKEN,
+    ADMIN_BOT_ID,
+    ADMIN_BOT_NAME,
+    BOT_HTTP_POOL_SIZE,
+    BOT_REFRESH_INTERVAL_S,
+    WEBHOOK_URL,
+)
+from .state import ALLOWED_UPDATES
+from .utils import close_async_http, orjson
 from .handlers import start, set_token, open_settings_cmd, handle_buttons, handle_text, _tap_all
 from .admin import (
     admin_add_bot,
@@ -27,8 +43,39 @@ def _ensure_admin_bot():
     add_bot_instance(bot_id, ADMIN_BOT_TOKEN, bot_name, role="admin", default_timezone="UTC")
 
 
+class _OrjsonRequest(HTTPXRequest):
+    """HTTPXRequest that decodes Bot API responses (getUpdates batches included) with orjson."""
+
+    @staticmethod
+    def parse_json_payload(payload: bytes):
+        try:
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            # invalid UTF-8 / JSON: keep PTB's own decoding and error reporting
+            return HTTPXRequest.parse_json_payload(payload)
+
+
+def _build_request(pool_size: int) -> HTTPXRequest:
+    # A warm keep-alive pool (multiplexed over one TLS connection on HTTP/2) so
+    # replies don't queue behind fresh TCP/TLS handshakes.
+    request_cls = _OrjsonRequest if orjson is not None else HTTPXRequest
+    return request_cls(
+        connection_pool_size=pool_size,
+        connect_timeout=5.0,
+        read_timeout=20.0,
+        pool_timeout=5.0,
+        http_version=_HTTP_VERSION,
+    )
+
+
 def _build_application(bot_row: dict):
-    app = ApplicationBuilder().token(bot_row["bot_token"]).build()
+    app = (
+        ApplicationBuilder()
+        .token(bot_row["bot_token"])
+        .request(_build_request(BOT_HTTP_POOL_SIZE))
+        .get_updates_request(_build_request(1))
+        .build()
+    )
     app.bot_data["bot_id"] = bot_row["bot_id"]
     app.bot_data["role"] = bot_row.get("role") or "user"
 
@@ -60,12 +107,22 @@ def _build_application(bot_row: dict):
 async def _start_application(app):
     await app.initialize()
     await app.start()
-    await app.updater.start_polling()
+    if WEBHOOK_URL:
+        from .webhook import register_webhook
+
+        await register_webhook(app)
+    else:
+        # Long polling: the request is held open until an update arrives.
+        await app.updater.start_polling(poll_interval=0.0, timeout=30, allowed_updates=ALLOWED_UPDATES)
 
 
 async def _stop_application(app):
+    if WEBHOOK_URL:
+        from .webhook import unregister_webhook
+
+        await unregister_webhook(app)
     try:
-        if app.updater:
+        if app.updater and app.updater.running:
             await app.updater.stop()
     except Exception:
         pass
@@ -85,6 +142,23 @@ async def _run_manager():
 
     apps: dict[str, Any] = {}
 
+    webhook_server = None
+    if WEBHOOK_URL:
+        from .webhook import start_webhook_server
+
+        # Listening before any set_webhook; if it stops later, every bot would go
+        # silent, so take the manager down (its finally stops the bots) instead.
+        webhook_server = await start_webhook_server()
+        manager = asyncio.current_task()
+
+        def _on_webhook_server_exit(task):
+            exc = None if task.cancelled() else task.exception()
+            print(f"❌ Webhook server exited ({exc!r}); stopping all bots.")
+            manager.cancel()
+
+        webhook_server[1].add_done_callback(_on_webhook_server_exit)
+        print(f"🌐 Webhook mode: {WEBHOOK_URL}/telegram/<bot_id>")
+
     async def _start_bot_row(row: dict):
         bot_id = row["bot_id"]
         if bot_id in apps:
@@ -94,27 +168,49 @@ async def _run_manager():
         apps[bot_id] = app
         print(f"✅ Bot started: {bot_id} (role={app.bot_data.get('role')})")
 
-    for row in list_bot_instances():
-        await _start_bot_row(row)
-
-    if not apps:
-        print("⚠️ No bots registered yet. Add admin bot via ADMIN_BOT_TOKEN or use /addbot after startup.")
-
-    while True:
-        await asyncio.sleep(BOT_REFRESH_INTERVAL_S)
-        rows = list_bot_instances()
-        row_by_id = {row["bot_id"]: row for row in rows}
-
-        for bot_id in list(apps.keys()):
-            if bot_id not in row_by_id:
-                app = apps.pop(bot_id)
-                await _stop_application(app)
-                print(f"🛑 Bot stopped: {bot_id} (removed from DB)")
-
-        for row in rows:
-            if row["bot_id"] not in apps:
-                await _start_bot_row(row)
+    try:
+        for row in list_bot_instances():
+            await _start_bot_row(row)
+
+        if not apps:
+            print("⚠️ No bots registered yet. Add admin bot via ADMIN_BOT_TOKEN or use /addbot after startup.")
+
+        while True:
+            await asyncio.sleep(BOT_REFRESH_INTERVAL_S)
+            rows = list_bot_instances()
+            row_by_id = {row["bot_id"]: row for row in rows}
+
+            for bot_id in list(apps.keys()):
+                if bot_id not in row_by_id:
+                    app = apps.pop(bot_id)
+                    await _stop_application(app)
+                    print(f"🛑 Bot stopped: {bot_id} (removed from DB)")
+            if not apps:
+                # The upstream client is shared by every bot; close it with the last one.
+                await close_async_http()
+
+            for row in rows:
+                if row["bot_id"] not in apps:
+                    await _start_bot_row(row)
+    finally:
+        for app in list(apps.values()):
+            await _stop_application(app)
+        await close_async_http()
+        if webhook_server is not None:
+            from .webhook import stop_webhook_server
+
+            server, task = webhook_server
+            task.remove_done_callback(_on_webhook_server_exit)
+            await stop_webhook_server(server, task)
 
 
 def run():
+    try:  # optional: faster event loop for the polling / reply traffic
+        import uvloop
+    except ImportError:
+        uvloop = None
+    if uvloop is not None:
+        # uvloop.run() sets the loop up directly; install() is deprecated on 3.12+
+        uvloop.run(_run_manager())
+        return
     asyncio.run(_run_manager())
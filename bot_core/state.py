@@ -1,10 +1,7 @@
 from typing import Optional
+from telegram import Update
 from telegram.ext import ContextTypes
 
-user_waiting_input = {}
-adding_slot_step = {}
-work_schedule_state = {}  # holds partial schedule input across two steps
-
 FIELD_MAPPING = {
     "change_price_min": "price_min",
     "change_price_max": "price_max",
@@ -16,6 +13,10 @@ FIELD_MAPPING = {
     "max_km": "max_km",
 }
 
+# Update types any handler reacts to; Telegram doesn't deliver (or long-poll
+# for) the rest, e.g. edited messages, chat-member and channel-post traffic.
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
 
 def _ctx_bot_id(context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
     try:
@@ -23,6 +24,3 @@ def _ctx_bot_id(context: ContextTypes.DEFAULT_TYPE) -> Optional[str]:
     except Exception:
         return None
 
-
-def _state_key(bot_id: Optional[str], user_id: int) -> tuple[str, int]:
-    return (bot_id or "", int(user_id))
@@ -1,45 +1,363 @@
-import json
+import asyncio
+import itertools
 import sqlite3
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 
-from db import DB_FILE
+from db import (
+    DB_FILE,
+    add_blocked_day as _db_add_blocked_day,
+    add_user as _db_add_user,
+    get_bl_uuid as _db_get_bl_uuid,
+    get_blocked_days as _db_get_blocked_days,
+    get_user_bundle as _db_get_user_bundle,
+    set_user_timezone as _db_set_user_timezone,
+    upsert_user_from_bot,
+)
+from .utils import _dumps, _loads
+
+
+# ── Shared connection ───────────────────────────────────────
+# Button handlers hit these helpers on every tap; reuse one connection instead
+# of paying connect/close (and a cold page cache) per query.
+_CONN: Optional[sqlite3.Connection] = None
+_CONN_LOCK = threading.Lock()
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _CONN
+    if _CONN is None:
+        # Every statement below is a fixed string, so sqlite3's per-connection
+        # statement cache keeps them prepared; leave room beyond the default 128.
+        conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None, cached_statements=256)
+        for pragma in (
+            "PRAGMA journal_mode=WAL",
+            "PRAGMA synchronous=NORMAL",
+            "PRAGMA temp_store=MEMORY",
+            "PRAGMA cache_size=-64000",
+            "PRAGMA busy_timeout=5000",
+        ):
+            try:
+                conn.execute(pragma)
+            except Exception:
+                pass
+        _CONN = conn
+    return _CONN
+
+
+def _fetchone(sql: str, params: tuple = ()):
+    with _CONN_LOCK:
+        return _get_conn().execute(sql, params).fetchone()
+
+
+def _execute(sql: str, params: tuple = ()):
+    with _CONN_LOCK:
+        _get_conn().execute(sql, params)
+
+
+def _in_txn(fn, *args):
+    """Run a multi-statement db helper on the shared connection as one transaction."""
+    with _CONN_LOCK:
+        conn = _get_conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(*args, conn=conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+
+# ── Short-lived per-user reads ──────────────────────────────
+# Menu navigation re-reads the same user row several times within a second or
+# two. get_active / get_user_bundle answer from here for _USER_TTL_S; writes made
+# through the bot drop the entry right away, other writers (poller, webapp) are
+# picked up once the TTL lapses.
+_USER_TTL_S = 2.0
+_USER_CACHE_MAX = 4096
+_USER_CACHE: "OrderedDict[Tuple[str, str, int], Tuple[float, object]]" = OrderedDict()
+# (bot_id, telegram_id) -> generation, bumped by invalidate_user(). A load that
+# raced an invalidation (e.g. a background warm_user across a toggle) sees the
+# generation move and doesn't store its stale result. Values come from one
+# global sequence, so an evicted and re-created entry never repeats an old one.
+_USER_GEN: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+_USER_GEN_SEQ = itertools.count(1)
+_USER_LOCK = threading.Lock()
+
+
+def _bounded_put(cache: OrderedDict, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > _USER_CACHE_MAX:
+        cache.popitem(last=False)
+
+
+def _ttl_cached(kind: str, bot_id: str, telegram_id: int, load):
+    key = (kind, bot_id, telegram_id)
+    now = time.monotonic()
+    with _USER_LOCK:
+        hit = _USER_CACHE.get(key)
+        if hit and now - hit[0] < _USER_TTL_S:
+            _USER_CACHE.move_to_end(key)
+            return hit[1]
+        gen = _USER_GEN.get((bot_id, telegram_id))
+    value = load()
+    with _USER_LOCK:
+        if _USER_GEN.get((bot_id, telegram_id)) == gen:
+            _bounded_put(_USER_CACHE, key, (now, value))
+    return value
+
+
+def invalidate_user(bot_id: str, telegram_id: int):
+    with _USER_LOCK:
+        _USER_CACHE.pop(("active", bot_id, telegram_id), None)
+        _USER_CACHE.pop(("bundle", bot_id, telegram_id), None)
+        _bounded_put(_USER_GEN, (bot_id, telegram_id), next(_USER_GEN_SEQ))
+
+
+def warm_user(bot_id: str, telegram_id: int):
+    """Load the rows the menus read next (filters, active flag, settings bundle) into the caches."""
+    get_filters(bot_id, telegram_id)
+    get_active(bot_id, telegram_id)
+    get_user_bundle(bot_id, telegram_id)
+
+
+def capture_user(bot_id: str, user_obj: dict, chat_obj: Optional[dict] = None):
+    # Runs on every update, so it shares the long-lived WAL connection.
+    with _CONN_LOCK:
+        upsert_user_from_bot(bot_id, user_obj, chat_obj, conn=_get_conn())
+
+
+def _load_user_bundle(bot_id: str, telegram_id: int) -> dict:
+    with _CONN_LOCK:
+        return _db_get_user_bundle(bot_id, telegram_id, conn=_get_conn())
+
+
+def get_user_bundle(bot_id: str, telegram_id: int) -> dict:
+    # Read on every settings / mobile-sessions render.
+    return _ttl_cached("bundle", bot_id, telegram_id, lambda: _load_user_bundle(bot_id, telegram_id))
+
+
+def get_blocked_days(bot_id: str, telegram_id: int):
+    with _CONN_LOCK:
+        return _db_get_blocked_days(bot_id, telegram_id, conn=_get_conn())
+
+
+def get_bl_uuid(bot_id: str, telegram_id: int):
+    # Checked from the identity thread spawned on every captured update.
+    with _CONN_LOCK:
+        return _db_get_bl_uuid(bot_id, telegram_id, conn=_get_conn())
+
+
+# Writes made from button taps / text input: one commit on the shared WAL
+# connection instead of a fresh connect + commit + close each.
+def add_user(bot_id: str, telegram_id: int):
+    _in_txn(_db_add_user, bot_id, telegram_id)
+
+
+def add_blocked_day(bot_id: str, telegram_id: int, day_str: str) -> bool:
+    return _in_txn(_db_add_blocked_day, bot_id, telegram_id, day_str)
+
+
+def set_user_timezone(bot_id: str, telegram_id: int, tz: str) -> bool:
+    changed = _in_txn(_db_set_user_timezone, bot_id, telegram_id, tz)
+    if changed:
+        invalidate_user(bot_id, telegram_id)
+    return changed
+
+
+async def db_run(fn, *args, **kwargs):
+    """Run a blocking DB helper (or menu builder that queries) off the event loop."""
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+_SQL_GET_TOKEN = "SELECT token FROM users WHERE bot_id = ? AND telegram_id = ?"
+_SQL_GET_ACTIVE = "SELECT active FROM users WHERE bot_id = ? AND telegram_id = ?"
+_SQL_SET_ACTIVE = (
+    "UPDATE users "
+    "SET active = ?, cache_version = COALESCE(cache_version, 0) + 1 "
+    "WHERE bot_id = ? AND telegram_id = ?"
+)
+_SQL_GET_FILTERS = (
+    "SELECT cache_version, CASE WHEN cache_version = ? THEN NULL ELSE filters END "
+    "FROM users WHERE bot_id = ? AND telegram_id = ?"
+)
+_SQL_PUT_FILTERS = (
+    "UPDATE users "
+    "SET filters = ?, cache_version = COALESCE(cache_version, 0) + 1 "
+    "WHERE bot_id = ? AND telegram_id = ? "
+    "RETURNING cache_version"
+)
 
 
 def _get_mobile_token(bot_id: str, user_id: int) -> Optional[str]:
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT token FROM users WHERE bot_id = ? AND telegram_id = ?", (bot_id, user_id))
-    row = c.fetchone()
-    conn.close()
+    row = _fetchone(_SQL_GET_TOKEN, (bot_id, user_id))
     return row[0] if row and row[0] else None
 
 
-def get_active(bot_id: str, telegram_id: int) -> bool:
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT active FROM users WHERE bot_id = ? AND telegram_id = ?", (bot_id, telegram_id))
-    row = c.fetchone()
-    conn.close()
+def _load_active(bot_id: str, telegram_id: int) -> bool:
+    row = _fetchone(_SQL_GET_ACTIVE, (bot_id, telegram_id))
     return bool(row[0]) if row else False
 
 
+def get_active(bot_id: str, telegram_id: int) -> bool:
+    return _ttl_cached("active", bot_id, telegram_id, lambda: _load_active(bot_id, telegram_id))
+
+
 def set_active(bot_id: str, telegram_id: int, active: bool):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute(
+    _execute(_SQL_SET_ACTIVE, (1 if active else 0, bot_id, telegram_id))
+    invalidate_user(bot_id, telegram_id)
+
+
+# ── Filters cache ───────────────────────────────────────────
+# Parsed filters per (bot_id, telegram_id), tagged with the users.cache_version
+# they were read at. Every writer (bot, webapp, admin) bumps cache_version, so a
+# matching version means the dict is current and the JSON blob is neither
+# fetched nor parsed again. Callers get their own copy to edit and hand back
+# through put_filters(); the cache only takes a dict once it has been written.
+_FILTERS_CACHE_MAX = 4096
+_FILTERS_CACHE: "OrderedDict[Tuple[str, int], Tuple[int, dict]]" = OrderedDict()
+_FILTERS_LOCK = threading.Lock()
+
+
+def _copy_json(obj):
+    # Filters are plain JSON data: nested dicts / lists of scalars.
+    if isinstance(obj, dict):
+        return {k: _copy_json(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_copy_json(v) for v in obj]
+    return obj
+
+
+def _lru_get(cache: OrderedDict, key):
+    with _FILTERS_LOCK:
+        hit = cache.get(key)
+        if hit is not None:
+            cache.move_to_end(key)
+        return hit
+
+
+def _lru_put(cache: OrderedDict, key, value):
+    with _FILTERS_LOCK:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > _FILTERS_CACHE_MAX:
+            cache.popitem(last=False)
+
+
+def _lru_drop(cache: OrderedDict, key):
+    with _FILTERS_LOCK:
+        cache.pop(key, None)
+
+
+def get_filters(bot_id: str, telegram_id: int) -> dict:
+    key = (bot_id, telegram_id)
+    cached = _lru_get(_FILTERS_CACHE, key)
+    known = cached[0] if cached and cached[0] is not None else -1
+    row = _fetchone(_SQL_GET_FILTERS, (known, bot_id, telegram_id))
+    if not row:
+        _lru_drop(_FILTERS_CACHE, key)
+        return {}
+    version, raw = row
+    if cached and version is not None and version == cached[0]:
+        return _copy_json(cached[1])
+    data = _loads(raw) if raw else {}
+    _lru_put(_FILTERS_CACHE, key, (version, data))
+    return _copy_json(data)
+
+
+def _keep_written(key, rows, filters_data: dict):
+    if rows:
+        _lru_put(_FILTERS_CACHE, key, (rows[0][0], _copy_json(filters_data)))
+    else:
+        _lru_drop(_FILTERS_CACHE, key)
+
+
+def put_filters(bot_id: str, telegram_id: int, filters_data: dict):
+    key = (bot_id, telegram_id)
+    try:
+        with _CONN_LOCK:
+            rows = _get_conn().execute(
+                _SQL_PUT_FILTERS, (_dumps(filters_data), bot_id, telegram_id)
+            ).fetchall()
+    except Exception:
+        _lru_drop(_FILTERS_CACHE, key)
+        raise
+    _keep_written(key, rows, filters_data)
+
+
+@lru_cache(maxsize=8)
+def _json_set_sql(n_keys: int) -> str:
+    # One statement text per arity (the bot sets one or two keys), so the
+    # connection's statement cache keeps each prepared.
+    pairs = ", ?, ?" * n_keys
+    return (
         "UPDATE users "
-        "SET active = ?, cache_version = COALESCE(cache_version, 0) + 1 "
-        "WHERE bot_id = ? AND telegram_id = ?",
-        (1 if active else 0, bot_id, telegram_id),
+        f"SET filters = json_set(COALESCE(filters, '{{}}'){pairs}), "
+        "cache_version = COALESCE(cache_version, 0) + 1 "
+        "WHERE bot_id = ? AND telegram_id = ? "
+        "RETURNING cache_version"
     )
-    conn.commit()
-    conn.close()
 
 
-def get_filters(bot_id: str, telegram_id: int) -> dict:
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT filters FROM users WHERE bot_id = ? AND telegram_id = ?", (bot_id, telegram_id))
-    row = c.fetchone()
-    conn.close()
-    return json.loads(row[0]) if row and row[0] else {}
+def put_filter_values(bot_id: str, telegram_id: int, filters_data: dict, updates: dict):
+    """
+    Set a few top-level keys in place with json_set() instead of re-serialising
+    the whole blob (blacklists included). `filters_data` is the dict from
+    get_filters(); it is updated to match.
+    """
+    key = (bot_id, telegram_id)
+    args = []
+    for field, value in updates.items():
+        args += ["$." + field, value]
+    try:
+        with _CONN_LOCK:
+            rows = _get_conn().execute(
+                _json_set_sql(len(updates)), (*args, bot_id, telegram_id)
+            ).fetchall()
+    except sqlite3.OperationalError:
+        # stored blob isn't valid JSON: rewrite it from the parsed dict
+        filters_data.update(updates)
+        put_filters(bot_id, telegram_id, filters_data)
+        return
+    filters_data.update(updates)
+    _keep_written(key, rows, filters_data)
+
+
+# ── Blacklist lookup index ──────────────────────────────────
+# Normalised (lower-cased / flight-code) sets of each blacklist, tagged with the
+# filters cache_version they were built from, so adding entries doesn't rebuild
+# the set from the whole list on every message. Sets are only grown after the
+# matching put_filters() succeeded.
+_BLACKLIST_INDEX: "OrderedDict[Tuple[str, int, str], Tuple[int, set]]" = OrderedDict()
+
+
+def _filters_version(bot_id: str, telegram_id: int):
+    cached = _lru_get(_FILTERS_CACHE, (bot_id, telegram_id))
+    return cached[0] if cached else None
+
+
+def get_blacklist_index(bot_id: str, telegram_id: int, key: str, items, normalise) -> set:
+    """Return the normalised set for `items` (the list from get_filters); read-only for callers."""
+    version = _filters_version(bot_id, telegram_id)
+    hit = _lru_get(_BLACKLIST_INDEX, (bot_id, telegram_id, key))
+    if hit and version is not None and hit[0] == version:
+        return hit[1]
+    index = {n for n in map(normalise, items) if n}
+    if version is not None:
+        _lru_put(_BLACKLIST_INDEX, (bot_id, telegram_id, key), (version, index))
+    return index
+
+
+def extend_blacklist_index(bot_id: str, telegram_id: int, key: str, index: set, added: set):
+    """After a successful put_filters(): add the new entries and re-tag the index."""
+    version = _filters_version(bot_id, telegram_id)
+    if version is None:
+        _lru_drop(_BLACKLIST_INDEX, (bot_id, telegram_id, key))
+        return
+    index.update(added)
+    _lru_put(_BLACKLIST_INDEX, (bot_id, telegram_id, key), (version, index))
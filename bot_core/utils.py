@@ -1,21 +1,52 @@
 import base64
 import json
+from http.cookiejar import CookieJar, DefaultCookiePolicy
 import re
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Optional
+from zoneinfo import available_timezones
 from dateutil.tz import gettz
-import requests
+import httpx
+from telegram import MessageEntity
 
 from .config import API_HOST
 
+try:  # optional: faster JSON for the filters blob and stored guest requests
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+def _loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 
 _JWT_PATTERN = r"[A-Za-z0-9\-_]+\.[A-Za-z0-9\-_]+\.[A-Za-z0-9\-_]+"
+# Compiled once at import: pasted dumps go through several of these per /token.
+_JWT_RE = re.compile(_JWT_PATTERN)
+_BEARER_JWT_RE = re.compile(rf"(?is)\bbearer\s+({_JWT_PATTERN})")
+_BEARER_TOKEN_RE = re.compile(rf"(?i)Bearer\s+{_JWT_PATTERN}")
+_AUTH_HEADER_RE = re.compile(r"(?im)^\s*authorization\s*:\s*(.+)$")
+_REQUEST_LINE_RE = re.compile(r"^[A-Z]+\s+\S+\s+HTTP/[\d.]+$")
+_HEADER_LINE_RE = re.compile(r"^[A-Za-z0-9_-]+\s*:\s*.+$")
+_FLAT_HEADER_KEY_RE = re.compile(r"(?:^|\s)([A-Za-z0-9_-]+)\s*:\s*")
+_WS_RE = re.compile(r"\s+")
+_CLIENT_ID_RE = re.compile(r"[A-Za-z0-9_-]{12,128}")
 
 
 def _extract_bearer_jwt(raw: str) -> Optional[str]:
     if not raw:
         return None
-    m = re.search(rf"(?is)\bbearer\s+({_JWT_PATTERN})", str(raw))
+    m = _BEARER_JWT_RE.search(str(raw))
     if m and m.group(1):
         return m.group(1).strip()
     return None
@@ -24,7 +55,7 @@ def _extract_bearer_jwt(raw: str) -> Optional[str]:
 def _is_bearer_token(s: str) -> bool:
     if not s:
         return False
-    return bool(re.match(rf"(?i)^Bearer\s+{_JWT_PATTERN}$", str(s).strip()))
+    return bool(_BEARER_TOKEN_RE.fullmatch(str(s).strip()))
 
 
 def _iter_header_pairs(raw: str) -> list[tuple[str, str]]:
@@ -38,9 +69,9 @@ def _iter_header_pairs(raw: str) -> list[tuple[str, str]]:
             continue
         if line.startswith(("{", "}", "[", "]", '"', "'")):
             continue
-        if re.match(r"^[A-Z]+\s+\S+\s+HTTP/[\d.]+$", line):
+        if _REQUEST_LINE_RE.match(line):
             continue
-        if not re.match(r"^[A-Za-z0-9_-]+\s*:\s*.+$", line):
+        if not _HEADER_LINE_RE.match(line):
             continue
         k, v = line.split(":", 1)
         k = k.strip()
@@ -52,10 +83,10 @@ def _iter_header_pairs(raw: str) -> list[tuple[str, str]]:
         return out
 
     # One-line fallback (e.g. `/token` args flattening all lines).
-    flat = " ".join(text.replace("\r", "\n").split())
+    flat = " ".join(text.split())
     if not flat:
         return out
-    matches = list(re.finditer(r"(?:^|\s)([A-Za-z0-9_-]+)\s*:\s*", flat))
+    matches = list(_FLAT_HEADER_KEY_RE.finditer(flat))
     for i, m in enumerate(matches):
         key = (m.group(1) or "").strip()
         start = m.end()
@@ -66,6 +97,11 @@ def _iter_header_pairs(raw: str) -> list[tuple[str, str]]:
     return out
 
 
+def _ci_starts(s: str, prefix: str) -> bool:
+    """Case-insensitive startswith for a lower-case prefix, without lowering the whole paste."""
+    return s[:len(prefix)].lower() == prefix
+
+
 def normalize_token(s: str) -> str:
     """
     Canonicalize to: 'Bearer <JWT>'.
@@ -86,22 +122,22 @@ def normalize_token(s: str) -> str:
         return f"Bearer {jwt_from_bearer}"
 
     # If a full HTTP request was pasted, extract the Authorization header line.
-    auth_match = re.search(r"(?im)^\s*authorization\s*:\s*(.+)$", raw)
+    auth_match = _AUTH_HEADER_RE.search(raw)
     s = auth_match.group(1).strip() if auth_match else raw
 
     # remove surrounding quotes
     if (s.startswith('"') and s.endswith('"')) or (s.startswith("'") and s.endswith("'")):
         s = s[1:-1].strip()
 
-    # collapse whitespace/newlines
-    s = " ".join(s.replace("\r", "\n").split())
+    # collapse whitespace/newlines (split() already breaks on \r)
+    s = " ".join(s.split())
 
     # drop leading 'authorization:' if present
-    if s.lower().startswith("authorization:"):
+    if _ci_starts(s, "authorization:"):
         s = s.split(":", 1)[1].strip()
 
     # already Bearer? keep but normalize capitalization/spacing
-    if s.lower().startswith("bearer "):
+    if _ci_starts(s, "bearer "):
         jwt = _extract_bearer_jwt(s)
         if jwt:
             return f"Bearer {jwt}"
@@ -109,12 +145,12 @@ def normalize_token(s: str) -> str:
         return f"Bearer {tok}" if tok else ""
 
     # plain JWT pattern?
-    if re.match(rf"^{_JWT_PATTERN}$", s):
+    if _JWT_RE.fullmatch(s):
         return f"Bearer {s}"
 
     # If the token was wrapped across lines in a HTTP dump, recover from raw text.
-    compact = re.sub(r"\s+", "", raw)
-    jwt_match = re.search(_JWT_PATTERN, compact)
+    compact = _WS_RE.sub("", raw)
+    jwt_match = _JWT_RE.search(compact)
     if jwt_match:
         return f"Bearer {jwt_match.group(0)}"
 
@@ -196,27 +232,35 @@ def parse_mobile_auth_material(raw: str) -> dict:
     if "\n" not in s and "\r" not in s:
         bare = s.strip().strip('"').strip("'")
         if bare:
-            if bare.lower().startswith("bearer ") and "token" not in out:
+            if _ci_starts(bare, "bearer ") and "token" not in out:
                 out["token"] = normalize_token(bare)
-            elif re.match(r"^[A-Za-z0-9\-_]+\.[A-Za-z0-9\-_]+\.[A-Za-z0-9\-_]+$", bare) and "token" not in out:
+            elif _JWT_RE.fullmatch(bare) and "token" not in out:
                 out["token"] = normalize_token(bare)
             elif bare.startswith("v1.") and "refresh_token" not in out:
                 out["refresh_token"] = bare
-            elif re.match(r"^[A-Za-z0-9_-]{12,128}$", bare) and ("client_id" not in out) and ("refresh_token" not in out):
+            elif _CLIENT_ID_RE.fullmatch(bare) and ("client_id" not in out) and ("refresh_token" not in out):
                 out["client_id"] = bare
 
     return out
 
 
+@lru_cache(maxsize=16)
+def _auth_value_patterns(key: str) -> tuple:
+    # JSON form first, then key=value / key: value; one compiled pair per key.
+    return (
+        re.compile(rf'"{re.escape(key)}"\s*:\s*"([^"]+)"', re.IGNORECASE),
+        re.compile(
+            rf"{re.escape(key)}\s*[:=]\s*['\"]?(Bearer\s+{_JWT_PATTERN}|{_JWT_PATTERN}|[^\s\"',&}}]+)",
+            re.IGNORECASE,
+        ),
+    )
+
+
 def _extract_auth_value(raw: str, key: str) -> Optional[str]:
     if not raw:
         return None
-    patterns = [
-        rf'"{re.escape(key)}"\s*:\s*"([^"]+)"',
-        rf"{re.escape(key)}\s*[:=]\s*['\"]?(Bearer\s+{_JWT_PATTERN}|{_JWT_PATTERN}|[^\s\"',&}}]+)",
-    ]
-    for pat in patterns:
-        m = re.search(pat, str(raw), flags=re.IGNORECASE)
+    for pat in _auth_value_patterns(key):
+        m = pat.search(str(raw))
         if m and m.group(1):
             return m.group(1).strip()
     return None
@@ -303,7 +347,41 @@ def _is_cloudfront_blocked_response(resp) -> bool:
         return False
 
 
-def validate_mobile_session(token: str, headers: Optional[dict] = None) -> tuple[bool, str]:
+try:  # optional: HTTP/2 to the Blacklane hosts needs the h2 package
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+_HTTP: Optional[httpx.AsyncClient] = None
+
+
+def _async_http() -> httpx.AsyncClient:
+    """
+    One keep-alive client for every upstream call the bot makes, created on
+    first use inside the running loop. Cookies are refused so one user's
+    session never rides along on another user's request.
+    """
+    global _HTTP
+    if _HTTP is None:
+        _HTTP = httpx.AsyncClient(
+            http2=_HTTP2,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            timeout=15,
+            cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+        )
+    return _HTTP
+
+
+async def close_async_http():
+    """Close the shared client on shutdown; a later call to _async_http() opens a new one."""
+    global _HTTP
+    client, _HTTP = _HTTP, None
+    if client is not None:
+        await client.aclose()
+
+
+async def validate_mobile_session(token: str, headers: Optional[dict] = None) -> tuple[bool, str]:
     """
     Quick upstream probe. Token should already be normalized
     (i.e., 'Bearer <JWT>').
@@ -324,8 +402,8 @@ def validate_mobile_session(token: str, headers: Optional[dict] = None) -> tuple
     network_error: Optional[str] = None
     for path in ("/offers?limit=1", "/rides?limit=1"):
         try:
-            r = requests.get(f"{API_HOST}{path}", headers=merged, timeout=12)
-        except requests.exceptions.RequestException as e:
+            r = await _async_http().get(f"{API_HOST}{path}", headers=merged, timeout=12)
+        except httpx.HTTPError as e:
             if not network_error:
                 network_error = f"network:{type(e).__name__}"
             continue
@@ -369,43 +447,96 @@ def mask_email(email: str | None) -> str:
 def fmt_money(price, currency):
     if price is None:
         return "—"
-    try:
-        return f"{float(price):.2f} {currency or ''}".strip()
-    except Exception:
-        return f"{price} {currency or ''}".strip()
+    if not isinstance(price, (int, float)):
+        try:
+            price = float(price)
+        except (TypeError, ValueError):
+            return f"{price} {currency or ''}".strip()
+    return f"{price:.2f} {currency or ''}".strip()
 
 
 def fmt_km(meters):
     if meters is None:
         return "—"
-    try:
-        return f"{float(meters)/1000.0:.1f} km"
-    except Exception:
-        return str(meters)
+    if not isinstance(meters, (int, float)):
+        try:
+            meters = float(meters)
+        except (TypeError, ValueError):
+            return str(meters)
+    return f"{meters / 1000.0:.1f} km"
 
 
 def fmt_minutes(mins):
     if mins is None:
         return "—"
-    try:
-        return f"{float(mins):.0f} min"
-    except Exception:
-        return str(mins)
+    if not isinstance(mins, (int, float)):
+        try:
+            mins = float(mins)
+        except (TypeError, ValueError):
+            return str(mins)
+    return f"{mins:.0f} min"
+
+
+@lru_cache(maxsize=256)
+def _gettz_cached(name: str):
+    """gettz() re-reads tzdata on a miss; resolve each IANA name once."""
+    return gettz(name)
 
 
+@lru_cache(maxsize=1)
+def _tz_names() -> frozenset:
+    return frozenset(available_timezones())
+
+
+def is_known_tz(name: str) -> bool:
+    """
+    Validate a user-typed zone against the IANA name list (built once) so a typo
+    is a set lookup rather than a tzdata probe that then sits in _gettz_cached.
+    """
+    if name.upper() in ("UTC", "GMT"):
+        return True
+    names = _tz_names()
+    if names:
+        return name in names
+    # no system tzdata / tzdata package to list: fall back to dateutil's own
+    return _gettz_cached(name) is not None
+
+
+@lru_cache(maxsize=4096)
 def fmt_dt_local(s, tz_name=None):
+    # Stats pages re-render the same rows while paginating; memoise per (value, zone).
+    return fmt_dt_local_tz(s, _gettz_cached(tz_name) if tz_name else None)
+
+
+def _parse_dt(s: str) -> datetime:
+    # Fast paths for the two shapes offer_logs actually stores:
+    #   YYYY-MM-DDTHH:MM:SSZ  and  YYYY-MM-DD HH:MM:SS (naive)
+    n = len(s)
+    if n == 20 and s[19] == "Z" and s[10] == "T":
+        return datetime(
+            int(s[0:4]), int(s[5:7]), int(s[8:10]),
+            int(s[11:13]), int(s[14:16]), int(s[17:19]),
+            tzinfo=timezone.utc,
+        )
+    if n == 19 and s[10] in " T":
+        return datetime(
+            int(s[0:4]), int(s[5:7]), int(s[8:10]),
+            int(s[11:13]), int(s[14:16]), int(s[17:19]),
+        )
+    iso = s.replace("Z", "+00:00")
+    if "T" in iso or "+" in iso:
+        return datetime.fromisoformat(iso)
+    return datetime.strptime(iso, "%Y-%m-%d %H:%M:%S")
+
+
+def fmt_dt_local_tz(s, tzinfo=None):
+    """Same as fmt_dt_local() but with an already-resolved tzinfo."""
     if not s:
         return "—"
     try:
-        iso = s.replace("Z", "+00:00")
-        if "T" in iso or "+" in iso:
-            dt = datetime.fromisoformat(iso)
-        else:
-            dt = datetime.strptime(iso, "%Y-%m-%d %H:%M:%S")
-        tzinfo = gettz(tz_name) if tz_name else None
-        if tzinfo:
-            return dt.astimezone(tzinfo).strftime("%Y-%m-%d %H:%M")
-        return dt.astimezone().strftime("%Y-%m-%d %H:%M")
+        local = _parse_dt(s).astimezone(tzinfo)  # tzinfo=None: system local zone
+        # "YYYY-MM-DD HH:MM" without strftime's locale-aware formatting (~4x faster)
+        return local.replace(tzinfo=None).isoformat(" ", "minutes")
     except Exception:
         return s
 
@@ -418,10 +549,17 @@ def safe(v, fallback="—"):
     return fallback if v in (None, "", []) else v
 
 
+@lru_cache(maxsize=4096)
+def _esc_str(s: str) -> str:
+    # Chained replace() beats str.translate() with a multi-char mapping here: each
+    # pass is a memchr scan that returns the original string when nothing matches.
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
 def _esc(s):
     if s is None:
         return "—"
-    return str(s).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return _esc_str(s if isinstance(s, str) else str(s))
 
 
 def _norm_guest_requests(val):
@@ -437,7 +575,7 @@ def _norm_guest_requests(val):
     try:
         if isinstance(val, str):
             # try json decode first
-            parsed = json.loads(val)
+            parsed = _loads(val)
             val = parsed
     except Exception:
         # keep as plain string
@@ -458,15 +596,89 @@ def _norm_guest_requests(val):
     return str(val)
 
 
+# Shape checks ahead of datetime(): same fields strptime accepted
+# (1-2 digit day/month/hour/minute, 4-digit year), without the _strptime machinery.
+_DT_RE = re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4}) (\d{1,2}):(\d{1,2})$")
+_DAY_RE = re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4})$")
+_HHMM_RE = re.compile(r"(\d{1,2}):(\d{1,2})")
+
+
 def validate_datetime(text: str):
+    m = _DT_RE.match(text or "")
+    if not m:
+        return None
+    d, mo, y, h, mi = map(int, m.groups())
     try:
-        return datetime.strptime(text, "%d/%m/%Y %H:%M")
+        return datetime(y, mo, d, h, mi)
     except ValueError:
         return None
 
 
 def validate_day(text: str):
+    m = _DAY_RE.match(text or "")
+    if not m:
+        return None
+    d, mo, y = map(int, m.groups())
     try:
-        return datetime.strptime(text, "%d/%m/%Y")
+        return datetime(y, mo, d)
     except ValueError:
         return None
+
+
+def validate_hhmm(text: str) -> bool:
+    m = _HHMM_RE.fullmatch(text or "")
+    return bool(m) and int(m.group(1)) < 24 and int(m.group(2)) < 60
+
+
+# ── Pre-parsed static Markdown ──────────────────────────────
+_MD_ENTITY_TYPES = {"*": MessageEntity.BOLD, "_": MessageEntity.ITALIC, "`": MessageEntity.CODE}
+
+
+def _utf16_len(s: str) -> int:
+    return len(s.encode("utf-16-le")) // 2
+
+
+def md_entities(text: str) -> tuple[str, tuple]:
+    """
+    Parse a fixed legacy-Markdown string (*bold*, _italic_, `code`, [text](url))
+    into (plain text, MessageEntity tuple) once, so constant prompts are sent with
+    entities= instead of asking Telegram to re-parse them on every send.
+    Offsets are in UTF-16 code units, as the Bot API expects.
+    """
+    out, entities = [], []
+    pos = 0  # UTF-16 offset of the end of `out`
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if ch == "\\" and i + 1 < n and text[i + 1] in "_*`[":
+            out.append(text[i + 1])
+            pos += 1
+            i += 2
+            continue
+        if ch in _MD_ENTITY_TYPES:
+            end = text.find(ch, i + 1)
+            if end == -1:
+                raise ValueError(f"unclosed {ch!r} in {text!r}")
+            inner = text[i + 1:end]
+            if inner:
+                length = _utf16_len(inner)
+                entities.append(MessageEntity(_MD_ENTITY_TYPES[ch], pos, length))
+                out.append(inner)
+                pos += length
+            i = end + 1
+            continue
+        if ch == "[":
+            mid = text.find("](", i + 1)
+            end = text.find(")", mid + 2) if mid != -1 else -1
+            if end != -1:
+                inner = text[i + 1:mid]
+                length = _utf16_len(inner)
+                entities.append(MessageEntity(MessageEntity.TEXT_LINK, pos, length, url=text[mid + 2:end]))
+                out.append(inner)
+                pos += length
+                i = end + 1
+                continue
+        out.append(ch)
+        pos += _utf16_len(ch)
+        i += 1
+    return "".join(out), tuple(entities)
@@ -0,0 +1,87 @@
+"""
+Webhook transport for all bots in the process.
+
+Telegram pushes each bot's updates to <WEBHOOK_URL>/telegram/<bot_id>; a single
+HTTP server hands them to the matching Application's update_queue, so the
+handlers run exactly as they do under polling.
+"""
+import asyncio
+import hashlib
+import hmac
+from typing import Any, Dict
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from telegram import Update
+
+from .config import WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET
+from .state import ALLOWED_UPDATES
+from .utils import _loads
+
+_APPS: Dict[str, Any] = {}
+
+api = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+
+
+def _secret_for(app) -> str:
+    # Telegram echoes this in X-Telegram-Bot-Api-Secret-Token; per-bot so one
+    # leaked URL can't be used to inject updates into another bot.
+    base = WEBHOOK_SECRET or app.bot.token
+    return hashlib.sha256(f"{base}:{app.bot_data['bot_id']}".encode()).hexdigest()
+
+
+@api.post("/telegram/{bot_id}")
+async def _receive(bot_id: str, request: Request):
+    app = _APPS.get(bot_id)
+    if app is None:
+        return Response(status_code=404)
+    given = request.headers.get("X-Telegram-Bot-Api-Secret-Token") or ""
+    if not hmac.compare_digest(given, app.bot_data["webhook_secret"]):
+        return Response(status_code=403)
+    update = Update.de_json(_loads(await request.body()), app.bot)
+    await app.update_queue.put(update)
+    return Response(status_code=200)
+
+
+async def register_webhook(app):
+    bot_id = app.bot_data["bot_id"]
+    app.bot_data["webhook_secret"] = _secret_for(app)
+    _APPS[bot_id] = app
+    await app.bot.set_webhook(
+        url=f"{WEBHOOK_URL}/telegram/{bot_id}",
+        secret_token=app.bot_data["webhook_secret"],
+        allowed_updates=ALLOWED_UPDATES,
+        max_connections=100,
+    )
+
+
+async def unregister_webhook(app):
+    _APPS.pop(app.bot_data.get("bot_id"), None)
+    try:
+        await app.bot.delete_webhook()
+    except Exception:
+        pass
+
+
+async def start_webhook_server():
+    """
+    Start the shared webhook server and wait until it is listening, so no bot
+    registers a webhook against a dead endpoint. Returns (server, task);
+    raises RuntimeError if it exits before it started (port in use, bad host).
+    """
+    server = uvicorn.Server(uvicorn.Config(api, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            exc = None if task.cancelled() else task.exception()
+            raise RuntimeError(f"webhook server failed to start on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}") from exc
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+async def stop_webhook_server(server, task):
+    server.should_exit = True
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
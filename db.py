@@ -17,6 +17,7 @@ from db_core.users import (
     get_active,
     set_active,
     get_user_timezone,
+    get_user_bundle,
     set_user_timezone,
     get_notifications,
     set_notification,
@@ -50,7 +51,12 @@ from db_core.offer_logs import (
     get_offer_logs_counts,
     get_offer_stats,
 )
-from db_core.pinned_warnings import get_pinned_warnings, save_pinned_warning, clear_pinned_warning
+from db_core.pinned_warnings import (
+    get_pinned_warnings,
+    save_pinned_warning,
+    clear_pinned_warning,
+    clear_pinned_warnings,
+)
 from db_core.custom_filters import (
     create_custom_filter,
     list_all_custom_filters,
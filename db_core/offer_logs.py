@@ -120,6 +120,8 @@ def get_processed_offer_ids(bot_id: str, telegram_id: int):
 
 def get_offer_logs(bot_id: str, telegram_id: int, limit: int = 10, offset: int = 0):
     conn = sqlite3.connect(DB_FILE, timeout=10)
+    # sqlite3.Row is indexable by column name; no per-row dict is built.
+    conn.row_factory = sqlite3.Row
     c = conn.cursor()
     c.execute(
         """
@@ -136,55 +138,32 @@ def get_offer_logs(bot_id: str, telegram_id: int, limit: int = 10, offset: int =
     )
     rows = c.fetchall()
     conn.close()
-    results = []
-    for r in rows:
-        results.append(
-            {
-                "offer_id": r[0],
-                "status": r[1],
-                "type": r[2],
-                "vehicle_class": r[3],
-                "price": r[4],
-                "currency": r[5],
-                "pickup_time": r[6],
-                "ends_at": r[7],
-                "pu_address": r[8],
-                "do_address": r[9],
-                "estimated_distance_meters": r[10],
-                "duration_minutes": r[11],
-                "km_included": r[12],
-                "guest_requests": r[13],
-                "flight_number": r[14],
-                "rejection_reason": r[15],
-                "notify_text": r[16],
-                "created_at": r[17],
-            }
-        )
-    return results
+    return rows
 
 
 def get_offer_logs_counts(bot_id: str, telegram_id: int):
     conn = sqlite3.connect(DB_FILE, timeout=10)
     c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM offer_logs WHERE bot_id = ? AND telegram_id = ?", (bot_id, telegram_id))
-    total = c.fetchone()[0] or 0
+    # One pass over idx_offer_logs_user_status instead of four COUNT queries
     c.execute(
-        "SELECT COUNT(*) FROM offer_logs WHERE bot_id = ? AND telegram_id = ? AND status = 'accepted'",
-        (bot_id, telegram_id),
-    )
-    accepted = c.fetchone()[0] or 0
-    c.execute(
-        "SELECT COUNT(*) FROM offer_logs WHERE bot_id = ? AND telegram_id = ? AND status = 'rejected'",
-        (bot_id, telegram_id),
-    )
-    rejected = c.fetchone()[0] or 0
-    c.execute(
-        "SELECT COUNT(*) FROM offer_logs WHERE bot_id = ? AND telegram_id = ? AND status = 'not_accepted'",
+        """
+        SELECT COUNT(*),
+               SUM(status = 'accepted'),
+               SUM(status = 'rejected'),
+               SUM(status = 'not_accepted')
+        FROM offer_logs
+        WHERE bot_id = ? AND telegram_id = ?
+    """,
         (bot_id, telegram_id),
     )
-    not_accepted = c.fetchone()[0] or 0
+    total, accepted, rejected, not_accepted = c.fetchone()
     conn.close()
-    return {"total": total, "accepted": accepted, "rejected": rejected, "not_accepted": not_accepted}
+    return {
+        "total": total or 0,
+        "accepted": accepted or 0,
+        "rejected": rejected or 0,
+        "not_accepted": not_accepted or 0,
+    }
 
 
 def get_offer_stats(
@@ -199,8 +178,10 @@ def get_offer_stats(
     """
     conn = sqlite3.connect(DB_FILE, timeout=10)
     c = conn.cursor()
+    # Aggregate in SQL: one row per distinct (status, type, class, currency)
+    # instead of every offer in the window.
     query = (
-        "SELECT status, type, vehicle_class, price, currency "
+        "SELECT status, type, vehicle_class, currency, COUNT(*), TOTAL(price) "
         "FROM offer_logs WHERE bot_id = ? AND telegram_id = ?"
     )
     params = [bot_id, telegram_id]
@@ -210,6 +191,7 @@ def get_offer_stats(
     if end_utc:
         query += " AND datetime(created_at) < datetime(?)"
         params.append(end_utc)
+    query += " GROUP BY status, type, vehicle_class, currency"
     c.execute(query, params)
     rows = c.fetchall()
     conn.close()
@@ -241,28 +223,25 @@ def get_offer_stats(
         }
         return mapping.get(val, cname or "—")
 
-    for status, otype, vclass, price, currency in rows:
-        stats["total"] += 1
+    for status, otype, vclass, currency, n, amount in rows:
+        stats["total"] += n
         if status == "accepted":
-            stats["accepted"] += 1
-            try:
-                stats["accepted_amount"] += float(price or 0)
-            except Exception:
-                pass
+            stats["accepted"] += n
+            stats["accepted_amount"] += amount
             if currency:
                 if stats["accepted_currency"] is None:
                     stats["accepted_currency"] = currency
                 elif stats["accepted_currency"] != currency:
                     stats["accepted_currency"] = "multi"
         elif status == "not_accepted":
-            stats["not_accepted"] += 1
+            stats["not_accepted"] += n
         else:
-            stats["rejected"] += 1
+            stats["rejected"] += n
 
         tkey = _norm_type(otype)
-        stats["type_counts"][tkey] = stats["type_counts"].get(tkey, 0) + 1
+        stats["type_counts"][tkey] = stats["type_counts"].get(tkey, 0) + n
 
         ckey = _norm_class(vclass)
-        stats["class_counts"][ckey] = stats["class_counts"].get(ckey, 0) + 1
+        stats["class_counts"][ckey] = stats["class_counts"].get(ckey, 0) + n
 
     return stats
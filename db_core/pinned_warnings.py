@@ -53,3 +53,16 @@ def clear_pinned_warning(bot_id: str, telegram_id: int, kind: str):
     )
     conn.commit()
     conn.close()
+
+
+def clear_pinned_warnings(bot_id: str, telegram_id: int):
+    """Clear both the no_token and expired pins in one statement."""
+    conn = sqlite3.connect(DB_FILE)
+    c = conn.cursor()
+    c.execute(
+        "UPDATE pinned_warnings SET no_token_msg_id = NULL, expired_msg_id = NULL "
+        "WHERE bot_id = ? AND telegram_id = ?",
+        (bot_id, telegram_id),
+    )
+    conn.commit()
+    conn.close()
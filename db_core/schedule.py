@@ -4,24 +4,28 @@ from datetime import datetime
 from .config import DB_FILE
 
 
-def get_blocked_days(bot_id: str, telegram_id: int):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute(
+def get_blocked_days(bot_id: str, telegram_id: int, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(DB_FILE)
+    rows = conn.execute(
         """
         SELECT id, day FROM blocked_days
         WHERE bot_id = ? AND telegram_id = ?
         ORDER BY day ASC
     """,
         (bot_id, telegram_id),
-    )
-    rows = c.fetchall()
-    conn.close()
+    ).fetchall()
+    if own_conn:
+        conn.close()
     return [{"id": r[0], "day": r[1]} for r in rows]
 
 
-def add_blocked_day(bot_id: str, telegram_id: int, day_str: str):
-    conn = sqlite3.connect(DB_FILE)
+def add_blocked_day(bot_id: str, telegram_id: int, day_str: str, conn=None) -> bool:
+    """Returns False when the day was already blocked (UNIQUE hit, nothing written)."""
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
     c.execute(
         """
@@ -30,12 +34,16 @@ def add_blocked_day(bot_id: str, telegram_id: int, day_str: str):
     """,
         (bot_id, telegram_id, day_str),
     )
-    c.execute(
-        "UPDATE users SET cache_version = COALESCE(cache_version, 0) + 1 WHERE bot_id = ? AND telegram_id = ?",
-        (bot_id, telegram_id),
-    )
-    conn.commit()
-    conn.close()
+    added = c.rowcount == 1
+    if added:
+        c.execute(
+            "UPDATE users SET cache_version = COALESCE(cache_version, 0) + 1 WHERE bot_id = ? AND telegram_id = ?",
+            (bot_id, telegram_id),
+        )
+    if own_conn:
+        conn.commit()
+        conn.close()
+    return added
 
 
 def delete_blocked_day(bot_id: str, day_id: int):
@@ -1,3 +1,4 @@
+import re
 import sqlite3
 import builtins as _builtins
 
@@ -31,6 +32,39 @@ def _ensure_tg_user_columns(cur):
         _add_column(cur, "users", name, typ)
 
 
+def _ensure_users_without_rowid(conn):
+    """
+    Rebuild a legacy rowid `users` table as WITHOUT ROWID so lookups by
+    (bot_id, telegram_id) hit the primary-key B-tree directly.
+    """
+    cur = conn.cursor()
+    row = cur.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'users'").fetchone()
+    if not row or not row[0] or "WITHOUT ROWID" in row[0].upper():
+        return
+    cols = [r[1] for r in cur.execute("PRAGMA table_info(users)").fetchall()]
+    new_sql = re.sub(r'(?i)^\s*CREATE\s+TABLE\s+"?users"?', "CREATE TABLE users_new", row[0], count=1)
+    col_list = ", ".join(f'"{c}"' for c in cols)
+    conn.commit()
+    try:
+        # Triggers on other tables reference `users`; keep RENAME from re-validating them.
+        cur.execute("PRAGMA legacy_alter_table=ON")
+        cur.execute("BEGIN")
+        cur.execute("DROP TABLE IF EXISTS users_new")
+        cur.execute(new_sql + " WITHOUT ROWID")
+        cur.execute(f"INSERT INTO users_new ({col_list}) SELECT {col_list} FROM users")
+        cur.execute("DROP TABLE users")
+        cur.execute("ALTER TABLE users_new RENAME TO users")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        _builtins.print(f"[init_db] users WITHOUT ROWID migration skipped: {e}")
+    finally:
+        try:
+            cur.execute("PRAGMA legacy_alter_table=OFF")
+        except Exception:
+            pass
+
+
 def init_db():
     conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
@@ -107,7 +141,7 @@ def init_db():
             hourly_Sprinter INTEGER DEFAULT 0,
             PRIMARY KEY (bot_id, telegram_id),
             FOREIGN KEY (bot_id) REFERENCES bot_instances(bot_id)
-        )
+        ) WITHOUT ROWID
     """
     )
     for alter_sql in [
@@ -246,6 +280,13 @@ def init_db():
         ON offer_logs(bot_id, telegram_id, offer_id)
     """
     )
+    # Covering index for the per-user status counts shown on the stats page
+    c.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_offer_logs_user_status
+        ON offer_logs(bot_id, telegram_id, status)
+    """
+    )
 
     # pinned warnings
     c.execute(
@@ -495,6 +536,7 @@ def init_db():
     _ensure_tg_user_columns(c)
 
     conn.commit()
+    _ensure_users_without_rowid(conn)
     conn.close()
 
     # Prune offer_logs older than 30 days to keep DB size under control.
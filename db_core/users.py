@@ -5,7 +5,11 @@ from datetime import datetime
 from .config import DB_FILE
 
 
-def upsert_user_from_bot(bot_id: str, user_obj: dict, chat_obj: dict | None = None):
+def upsert_user_from_bot(bot_id: str, user_obj: dict, chat_obj: dict | None = None, conn=None):
+    """
+    Record the Telegram profile seen on an update. Pass `conn` to reuse an
+    open (autocommit) connection; otherwise a short-lived one is opened.
+    """
     if not user_obj or "id" not in user_obj:
         return
     uid = int(user_obj["id"])
@@ -23,37 +27,41 @@ def upsert_user_from_bot(bot_id: str, user_obj: dict, chat_obj: dict | None = No
 
     now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-
-    cur.execute(
-        "INSERT OR IGNORE INTO users(bot_id, telegram_id, active) VALUES (?, ?, 1)",
-        (bot_id, uid),
-    )
-    cur.execute(
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(DB_FILE)
+    # Single UPSERT: new rows start active, existing rows only get their tg_* refreshed
+    conn.execute(
         """
-        UPDATE users
-           SET tg_first_name = ?,
-               tg_last_name  = ?,
-               tg_username   = ?,
-               tg_lang       = ?,
-               tg_is_premium = ?,
-               tg_last_seen  = ?,
-               tg_chat_type  = ?,
-               tg_chat_id    = ?,
-               tg_chat_title = ?,
-               tg_first_seen = COALESCE(tg_first_seen, ?)
-         WHERE bot_id = ? AND telegram_id = ?
+        INSERT INTO users(
+            bot_id, telegram_id, active,
+            tg_first_name, tg_last_name, tg_username, tg_lang, tg_is_premium,
+            tg_last_seen, tg_chat_type, tg_chat_id, tg_chat_title, tg_first_seen
+        )
+        VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(bot_id, telegram_id) DO UPDATE SET
+            tg_first_name = excluded.tg_first_name,
+            tg_last_name  = excluded.tg_last_name,
+            tg_username   = excluded.tg_username,
+            tg_lang       = excluded.tg_lang,
+            tg_is_premium = excluded.tg_is_premium,
+            tg_last_seen  = excluded.tg_last_seen,
+            tg_chat_type  = excluded.tg_chat_type,
+            tg_chat_id    = excluded.tg_chat_id,
+            tg_chat_title = excluded.tg_chat_title,
+            tg_first_seen = COALESCE(users.tg_first_seen, excluded.tg_first_seen)
     """,
-        (first, last, uname, lang, prem, now, chat_type, chat_id, chat_title, now, bot_id, uid),
+        (bot_id, uid, first, last, uname, lang, prem, now, chat_type, chat_id, chat_title, now),
     )
-
-    conn.commit()
-    conn.close()
+    if own_conn:
+        conn.commit()
+        conn.close()
 
 
-def add_user(bot_id: str, telegram_id: int):
-    conn = sqlite3.connect(DB_FILE)
+def add_user(bot_id: str, telegram_id: int, conn=None):
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
     c.execute("SELECT default_timezone FROM bot_instances WHERE bot_id = ?", (bot_id,))
     row = c.fetchone()
@@ -68,8 +76,9 @@ def add_user(bot_id: str, telegram_id: int):
         "AND (timezone IS NULL OR timezone = '' OR timezone = 'UTC')",
         (tz, bot_id, telegram_id),
     )
-    conn.commit()
-    conn.close()
+    if own_conn:
+        conn.commit()
+        conn.close()
 
 
 def update_token(
@@ -346,17 +355,58 @@ def get_user_timezone(bot_id: str, telegram_id: int) -> str:
     return row[0] if row and row[0] else "UTC"
 
 
-def set_user_timezone(bot_id: str, telegram_id: int, tz: str):
-    conn = sqlite3.connect(DB_FILE)
+def get_user_bundle(bot_id: str, telegram_id: int, conn=None) -> dict:
+    """
+    Timezone, token status, mobile token, auto-refresh flag, notification
+    preferences and BL email in one lookup (settings/session menus).
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(DB_FILE)
+    row = conn.execute(
+        "SELECT timezone, token_status, token, token_auto_refresh, "
+        "COALESCE(notify_accepted,1), COALESCE(notify_not_accepted,1), COALESCE(notify_rejected,1), bl_email "
+        "FROM users WHERE bot_id = ? AND telegram_id = ?",
+        (bot_id, telegram_id),
+    ).fetchone()
+    if own_conn:
+        conn.close()
+    if not row:
+        return {
+            "timezone": "UTC",
+            "token_status": "unknown",
+            "token": None,
+            "token_auto_refresh": False,
+            "notifications": {"accepted": True, "not_accepted": True, "rejected": True},
+            "bl_email": None,
+        }
+    return {
+        "timezone": row[0] or "UTC",
+        "token_status": row[1] or "unknown",
+        "token": row[2] or None,
+        "token_auto_refresh": bool(row[3]),
+        "notifications": {"accepted": bool(row[4]), "not_accepted": bool(row[5]), "rejected": bool(row[6])},
+        "bl_email": row[7] or None,
+    }
+
+
+def set_user_timezone(bot_id: str, telegram_id: int, tz: str, conn=None) -> bool:
+    """Returns False when the user already had `tz` (nothing written)."""
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
     c.execute(
         "UPDATE users "
         "SET timezone = ?, cache_version = COALESCE(cache_version, 0) + 1 "
-        "WHERE bot_id = ? AND telegram_id = ?",
-        (tz, bot_id, telegram_id),
+        "WHERE bot_id = ? AND telegram_id = ? AND timezone IS NOT ?",
+        (tz, bot_id, telegram_id, tz),
     )
-    conn.commit()
-    conn.close()
+    changed = c.rowcount == 1
+    if own_conn:
+        conn.commit()
+        conn.close()
+    return changed
 
 
 def get_notifications(bot_id: str, telegram_id: int) -> dict:
@@ -453,10 +503,13 @@ def set_bl_uuid(bot_id: str, telegram_id: int, bl_uuid: str):
     conn.close()
 
 
-def get_bl_uuid(bot_id: str, telegram_id: int) -> str | None:
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT bl_uuid FROM users WHERE bot_id = ? AND telegram_id = ?", (bot_id, telegram_id))
-    row = c.fetchone()
-    conn.close()
+def get_bl_uuid(bot_id: str, telegram_id: int, conn=None) -> str | None:
+    own_conn = conn is None
+    if own_conn:
+        conn = sqlite3.connect(DB_FILE)
+    row = conn.execute(
+        "SELECT bl_uuid FROM users WHERE bot_id = ? AND telegram_id = ?", (bot_id, telegram_id)
+    ).fetchone()
+    if own_conn:
+        conn.close()
     return row[0] if row and row[0] else None
@@ -28,22 +28,21 @@ def get_vehicle_classes_state(bot_id: str, telegram_id: int):
 
 
 def toggle_vehicle_class(bot_id: str, telegram_id: int, mode: str, vclass: str):
+    if mode not in ("transfer", "hourly") or vclass not in VEHICLE_CLASSES:
+        return None
     column = f"{mode}_{vclass}"
     conn = sqlite3.connect(DB_FILE)
     c = conn.cursor()
-    c.execute(f"SELECT {column} FROM users WHERE bot_id = ? AND telegram_id = ?", (bot_id, telegram_id))
-    current = c.fetchone()
-    if current is None:
-        conn.close()
-        return None
-    current_val = current[0]
-    new_val = 0 if current_val == 1 else 1
+    # Flip in place and read the new value back in the same statement.
     c.execute(
         f"UPDATE users "
-        f"SET {column} = ?, cache_version = COALESCE(cache_version, 0) + 1 "
-        f"WHERE bot_id = ? AND telegram_id = ?",
-        (new_val, bot_id, telegram_id),
+        f"SET {column} = CASE WHEN {column} = 1 THEN 0 ELSE 1 END, "
+        f"cache_version = COALESCE(cache_version, 0) + 1 "
+        f"WHERE bot_id = ? AND telegram_id = ? "
+        f"RETURNING {column}",
+        (bot_id, telegram_id),
     )
+    row = c.fetchone()
     conn.commit()
     conn.close()
-    return new_val
+    return row[0] if row else None
@@ -61,7 +61,7 @@ from .filters import _get_enabled_filter_slugs
 from .metrics import observe_ms
 from .notify import (
     pin_warning_if_needed,
-    unpin_warning_if_any,
+    unpin_token_warnings,
     _resolve_bot_token,
     tg_unpin_message,
     tg_send_message,
@@ -411,8 +411,7 @@ def poll_user(user):
                         _p1_skip_until.pop(_ar_key, None)
                         set_token_status(bot_id, telegram_id, "valid")
                         set_token_ok_mem(bot_id, telegram_id, cache_version)
-                        unpin_warning_if_any(bot_id, telegram_id, "expired")
-                        unpin_warning_if_any(bot_id, telegram_id, "no_token")
+                        unpin_token_warnings(bot_id, telegram_id)
                         bot_tok = _resolve_bot_token(bot_id, telegram_id)
                         tg_send_message(bot_tok, telegram_id, "✅ <b>Token refreshed successfully</b> — bot is back online.")
                         _log_offers_found("P1", telegram_id, results2 or [])
@@ -486,8 +485,7 @@ def poll_user(user):
                         _p1_skip_until.pop(_ar_key, None)
                         set_token_status(bot_id, telegram_id, "valid")
                         set_token_ok_mem(bot_id, telegram_id, cache_version)
-                        unpin_warning_if_any(bot_id, telegram_id, "expired")
-                        unpin_warning_if_any(bot_id, telegram_id, "no_token")
+                        unpin_token_warnings(bot_id, telegram_id)
                         bot_tok = _resolve_bot_token(bot_id, telegram_id)
                         tg_send_message(bot_tok, telegram_id, "✅ <b>Token refreshed successfully</b> — bot is back online.")
                         _log_offers_found("P1", telegram_id, results2 or [])
@@ -526,8 +524,7 @@ def poll_user(user):
             _p1_fail_counts.pop((str(bot_id), int(telegram_id)), None)
             if not is_token_ok_mem(bot_id, telegram_id, cache_version):
                 set_token_status(bot_id, telegram_id, "valid")
-                unpin_warning_if_any(bot_id, telegram_id, "expired")
-                unpin_warning_if_any(bot_id, telegram_id, "no_token")
+                unpin_token_warnings(bot_id, telegram_id)
                 set_token_ok_mem(bot_id, telegram_id, cache_version)
             offers = results or []
             _log_offers_found("P1", telegram_id, offers)
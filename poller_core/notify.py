@@ -1,9 +1,10 @@
 import requests
+import threading
 import time
 from typing import Optional
 from datetime import datetime
 
-from .config import BOT_TOKEN
+from .config import BOT_TOKEN, HTTP_POOL_SIZE
 from .utils import _split_chunks, _strip_html_tags
 from db import (
     get_notifications,
@@ -11,6 +12,7 @@ from db import (
     get_pinned_warnings,
     save_pinned_warning,
     clear_pinned_warning,
+    clear_pinned_warnings,
 )
 
 
@@ -20,6 +22,25 @@ def _quiet_print(*args, **kwargs):
 
 print = _quiet_print
 
+_thread_local = threading.local()
+
+
+def _get_tg_session() -> requests.Session:
+    # Keep-alive to api.telegram.org per worker thread: sends, pins and unpins
+    # reuse the TLS connection instead of a handshake per call.
+    sess = getattr(_thread_local, "session", None)
+    if sess is None:
+        sess = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=HTTP_POOL_SIZE,
+            pool_maxsize=HTTP_POOL_SIZE,
+            max_retries=0,
+        )
+        sess.mount("https://", adapter)
+        _thread_local.session = sess
+    return sess
+
+
 def _platform_icon(offer_or_platform) -> str:
     # accepts offer dict or plain "p1"/"p2" string
     plat = offer_or_platform
@@ -52,7 +73,7 @@ def _send_one(
         payload["reply_markup"] = reply_markup
     if parse_mode:
         payload["parse_mode"] = parse_mode
-    r = requests.post(url, json=payload, timeout=15)
+    r = _get_tg_session().post(url, json=payload, timeout=15)
     if r.status_code >= 400:
         try:
             print(f"[{datetime.now()}] ❌ Telegram error {r.status_code}: {r.json()}")
@@ -168,7 +189,7 @@ def tg_pin_message(bot_token: Optional[str], chat_id: int, message_id: int):
     if not bot_token:
         return
     try:
-        requests.post(
+        _get_tg_session().post(
             f"https://api.telegram.org/bot{bot_token}/pinChatMessage",
             json={"chat_id": chat_id, "message_id": message_id, "disable_notification": False},
             timeout=10,
@@ -181,7 +202,7 @@ def tg_unpin_message(bot_token: Optional[str], chat_id: int, message_id: int):
     if not bot_token:
         return
     try:
-        requests.post(
+        _get_tg_session().post(
             f"https://api.telegram.org/bot{bot_token}/unpinChatMessage",
             json={"chat_id": chat_id, "message_id": message_id},
             timeout=10,
@@ -245,3 +266,15 @@ def unpin_warning_if_any(bot_id: str, telegram_id: int, kind: str):
         bot_token = _resolve_bot_token(bot_id, telegram_id)
         tg_unpin_message(bot_token, telegram_id, msg_id)
         clear_pinned_warning(bot_id, telegram_id, kind)
+
+
+def unpin_token_warnings(bot_id: str, telegram_id: int):
+    """Unpin both token warnings (expired / no_token): one read, one clear."""
+    existing = get_pinned_warnings(bot_id, telegram_id)
+    msg_ids = [m for m in (existing["expired_msg_id"], existing["no_token_msg_id"]) if m]
+    if not msg_ids:
+        return
+    bot_token = _resolve_bot_token(bot_id, telegram_id)
+    for msg_id in msg_ids:
+        tg_unpin_message(bot_token, telegram_id, msg_id)
+    clear_pinned_warnings(bot_id, telegram_id)
@@ -8,6 +8,7 @@ import threading
 import time
 import builtins as _builtins
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional, Tuple
 
 import requests
@@ -72,7 +73,9 @@ def _header_drop(headers: dict, name: str):
             headers.pop(k, None)
 
 
+@lru_cache(maxsize=4096)
 def _jwt_exp_unverified(token: str) -> Optional[int]:
+    # Pure function of the token string; polled tokens are re-checked every cycle.
     try:
         raw = token[7:].strip() if str(token).lower().startswith("bearer ") else token
         parts = (raw or "").split(".")
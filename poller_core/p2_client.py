@@ -2,6 +2,7 @@ import base64
 import json
 import threading
 import builtins as _builtins
+from functools import lru_cache
 from typing import Optional, Tuple
 from datetime import datetime
 import requests
@@ -324,6 +325,7 @@ def _athena_login(email: str, password: str) -> Tuple[bool, Optional[str], str]:
         return (False, None, f"network:{type(e).__name__}")
 
 
+@lru_cache(maxsize=4096)
 def _jwt_exp_unverified(token: str) -> Optional[int]:
     """Best-effort read of 'exp' (seconds since epoch) from a JWT without verifying; None if not readable."""
     try:
@@ -64,6 +64,29 @@ from .metrics import observe_ms
 from db import log_offer_decision, save_offer_message, set_token_status
 
 
+# ── Blacklist lookups ───────────────────────────────────────
+# Built once per _process_offers_for_user call and reused for every offer.
+_FLIGHT_NON_ALNUM_RE = re.compile(r"[^A-Za-z0-9]")
+
+
+def _norm_flight(s) -> str:
+    return _FLIGHT_NON_ALNUM_RE.sub("", str(s or "")).upper()
+
+
+def _flight_blocklist(terms) -> Dict[str, str]:
+    """Normalised flight number -> first stored entry with that number."""
+    out: Dict[str, str] = {}
+    for t in terms:
+        n = _norm_flight(t)
+        if n and n not in out:
+            out[n] = t
+    return out
+
+
+def _blacklist_terms(terms) -> tuple:
+    return tuple((t, t.lower()) for t in terms if t and t.strip())
+
+
 def _quiet_print(*args, **kwargs):
     return None
 
@@ -689,6 +712,10 @@ def _process_offers_for_user(
                 _s, _e = _e, _s
             _parsed_booked_slots.append((_s, _e, _slot))
 
+    pickup_terms = _blacklist_terms(filters.get("pickup_blacklist") or [])
+    dropoff_terms = _blacklist_terms(filters.get("dropoff_blacklist") or [])
+    flight_blocked = _flight_blocklist(filters.get("flight_blacklist") or [])
+
     for offer in offers:
         filter_t0 = time.perf_counter()
         oid = offer.get("id")
@@ -875,8 +902,6 @@ def _process_offers_for_user(
                     record_result("Km inclus max", ok, None if ok else f"{km_inc:g} > {float(h_max_km):g}")
 
         # 3) Blacklists
-        pickup_terms = (filters.get("pickup_blacklist") or [])
-        dropoff_terms = (filters.get("dropoff_blacklist") or [])
         pu_addr = _extract_addr(rid.get("pickUpLocation"))
         do_addr = _extract_addr(rid.get("dropOffLocation")) if rid.get("dropOffLocation") else ""
 
@@ -884,8 +909,8 @@ def _process_offers_for_user(
             if not text or not terms:
                 return None
             low = text.lower()
-            for term in terms:
-                if term and term.strip() and term.lower() in low:
+            for term, term_low in terms:
+                if term_low in low:
                     return term
             return None
 
@@ -898,19 +923,15 @@ def _process_offers_for_user(
             record_result("Dropoff blacklist", hit_do is None, None if hit_do is None else f"dropoff contient «{hit_do}»")
 
         # 3.5) Flight blocklist
-        flight_terms = (filters.get("flight_blacklist") or [])
         flight_no = None
         if isinstance(rid.get("flight"), dict):
             flight_no = rid.get("flight", {}).get("number")
         if not flight_no:
             flight_no = rid.get("flight_number") or offer.get("flight_number")
-        if flight_terms:
-            def _norm_flight(s: str) -> str:
-                return re.sub(r"[^A-Za-z0-9]", "", str(s or "")).upper()
-
+        if flight_blocked:
             if flight_no:
                 target = _norm_flight(flight_no)
-                hit = next((t for t in flight_terms if _norm_flight(t) == target and target), None)
+                hit = flight_blocked.get(target) if target else None
                 record_result("Vols bloqués", hit is None, None if hit is None else f"vol {flight_no} bloqué")
             else:
                 record_result("Vols bloqués", True, "aucun numéro de vol")
@@ -74,34 +74,42 @@ def _prio(row):
 def _esc(s: Optional[str]) -> str:
     if s is None:
         return "—"
-    return str(s).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    if not isinstance(s, str):
+        s = str(s)
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
 
 def _fmt_money(price, currency) -> str:
     if price is None:
         return "—"
-    try:
-        return f"{float(price):.2f} {currency or ''}".strip()
-    except Exception:
-        return f"{price} {currency or ''}".strip()
+    if not isinstance(price, (int, float)):
+        try:
+            price = float(price)
+        except (TypeError, ValueError):
+            return f"{price} {currency or ''}".strip()
+    return f"{price:.2f} {currency or ''}".strip()
 
 
 def _fmt_km(meters) -> str:
     if meters is None:
         return "—"
-    try:
-        return f"{float(meters)/1000.0:.3f} km"
-    except Exception:
-        return str(meters)
+    if not isinstance(meters, (int, float)):
+        try:
+            meters = float(meters)
+        except (TypeError, ValueError):
+            return str(meters)
+    return f"{meters / 1000.0:.3f} km"
 
 
 def _fmt_minutes(mins) -> str:
     if mins is None:
         return "—"
-    try:
-        return f"{float(mins):.0f} min"
-    except Exception:
-        return str(mins)
+    if not isinstance(mins, (int, float)):
+        try:
+            mins = float(mins)
+        except (TypeError, ValueError):
+            return str(mins)
+    return f"{mins:.0f} min"
 
 
 def _split_chunks(text: str, limit: int = 4096) -> Iterable[str]:
@@ -287,10 +287,17 @@ def _parse_dt(s: str) -> Optional[datetime]:
 def _fmt_ddmmyyyy(dt: datetime) -> str:
     return dt.strftime("%d/%m/%Y %H:%M")
 
+# Same fields strptime("%d/%m/%Y") accepts, matched without the _strptime machinery.
+_DAY_RE = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
+
 def _parse_day_ddmmyyyy(s: str) -> datetime | None:
+    m = _DAY_RE.fullmatch(s.strip())
+    if not m:
+        return None
+    d, mo, y = map(int, m.groups())
     try:
-        return datetime.strptime(s.strip(), "%d/%m/%Y")
-    except Exception:
+        return datetime(y, mo, d)
+    except ValueError:
         return None
 
 def _fmt_day_ddmmyyyy(dt: datetime) -> str:
@@ -891,16 +898,14 @@ def toggle_blocked_day(
     if not dt:
         raise HTTPException(400, detail={"error": "bad_day_format", "expected": "dd/mm/YYYY", "got": payload.day})
     day = _fmt_day_ddmmyyyy(dt)
-    existing = {d["day"] for d in get_blocked_days(bot_id, uid)}
-    if day in existing:
-        for d in get_blocked_days(bot_id, uid):
-            if d["day"] == day:
-                delete_blocked_day(bot_id, d["id"])
-                return {"ok": True, "blocked": False, "day": day}
-        raise HTTPException(404, "Not found")
-    else:
-        add_blocked_day(bot_id, uid, day)
+    # INSERT OR IGNORE is the membership test; only an already-blocked day needs its id.
+    if add_blocked_day(bot_id, uid, day):
         return {"ok": True, "blocked": True, "day": day}
+    for d in get_blocked_days(bot_id, uid):
+        if d["day"] == day:
+            delete_blocked_day(bot_id, d["id"])
+            return {"ok": True, "blocked": False, "day": day}
+    raise HTTPException(404, "Not found")
 
 # --- Rides (Hades first per your steps; fallback to mobile ONLY if no creds) ---
 @app.get("/webapp/rides")